@@ -0,0 +1,84 @@
+"""Сохранение прогресса парсера для продолжения обхода после сбоя."""
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+
+class CrawlState:
+    """Журнал прогресса обхода каталога в файле JSON lines.
+
+    Каждый успешно загруженный результат (число страниц каталога, ID
+    ноутбуков страницы, названия и цены страницы, характеристики ноутбука)
+    дописывается в конец файла отдельной строкой и сразу сбрасывается на
+    диск. Файл только дополняется, поэтому сбой во время записи может
+    испортить лишь последнюю строку, которая при чтении пропускается. При
+    следующем запуске журнал читается целиком и загруженное повторно не
+    запрашивается.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listing: Optional[Dict[str, int]] = None
+        self.pages: Dict[int, List[str]] = {}
+        self.names: Dict[int, Dict[str, str]] = {}
+        self.prices: Dict[int, Dict[str, Dict[str, int]]] = {}
+        self.characteristics: Dict[str, Dict[str, str]] = {}
+        self.n_records = 0
+        torn = os.path.exists(path) and not self._load()
+        self.file = open(path, 'a', encoding='UTF-8')
+        if torn:
+            # Следующая запись начинается с новой строки, а не продолжает недописанную
+            self.file.write('\n')
+
+    def _load(self) -> bool:
+        """Читает журнал и возвращает, дописана ли последняя строка"""
+        complete = True
+        with open(self.path, encoding='UTF-8') as file:
+            for line in file:
+                complete = line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # Недописанная при сбое строка
+                    continue
+                self._apply(record)
+                self.n_records += 1
+        return complete
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        kind, data = record['kind'], record['data']
+        if kind == 'listing':
+            self.listing = data
+        elif kind == 'page':
+            self.pages[record['page']] = data
+        elif kind == 'names':
+            self.names[record['page']] = data
+        elif kind == 'prices':
+            self.prices[record['page']] = data
+        elif kind == 'characteristics':
+            self.characteristics.update(data)
+        else:
+            raise ValueError(f'Unknown record kind {kind} in {self.path}')
+
+    def append(self, kind: str, data: Any, page: int = None) -> None:
+        """Дописывает результат в журнал.
+
+        :param kind: тип результата: listing, page, names, prices или characteristics
+        :param data: загруженные данные
+        :param page: номер страницы каталога для page, names и prices
+        """
+        record = {'kind': kind, 'data': data}
+        if page is not None:
+            record['page'] = page
+        self._apply(record)
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.n_records += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+    def remove(self) -> None:
+        """Удаляет журнал после завершенного обхода"""
+        self.close()
+        os.remove(self.path)
@@ -0,0 +1,120 @@
+"""Асинхронный HTTP клиент парсера с ограничением нагрузки на сайт."""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Статусы ответа, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket.
+
+    Корзина вмещает burst токенов и пополняется со скоростью rate токенов
+    в секунду. Каждый запрос забирает один токен, а при пустой корзине
+    ждет, пока накопится следующий.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CrawlerClient:
+    """Сессия aiohttp с пулом соединений, лимитом частоты на хост и повторами.
+
+    Одновременно выполняется не больше max_concurrency запросов, к каждому
+    хосту - не больше rate запросов в секунду. Неудачный запрос (ошибка
+    соединения, статус из RETRY_STATUSES или ответ не в формате JSON, которым
+    сайт отвечает при блокировке) повторяется до max_retries раз с
+    экспоненциальной задержкой со случайной составляющей (full jitter).
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = 8,
+            rate: float = 10.0,
+            burst: int = 10,
+            max_retries: int = 5,
+            backoff_base: float = 1.0,
+            backoff_max: float = 60.0,
+            timeout: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.n_requests = 0
+        self.n_retries = 0
+
+    async def __aenter__(self) -> 'CrawlerClient':
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.buckets[host]
+
+    def backoff(self, attempt: int) -> float:
+        """Задержка перед повтором номер attempt (с нуля)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def request_json(self, method: str, url: str, **request_parameters) -> Any:
+        """Выполняет запрос и возвращает разобранный JSON ответа.
+
+        :param method: HTTP метод
+        :param url: адрес запроса
+        :param request_parameters: cookies, headers, params и json запроса
+        :return содержимое ответа
+        :raises последнюю ошибку, если все попытки неудачны
+        """
+        for attempt in range(self.max_retries):
+            await self.bucket(url).acquire()
+            try:
+                async with self.semaphore:
+                    self.n_requests += 1
+                    async with self.session.request(method, url, **request_parameters) as response:
+                        if response.status in RETRY_STATUSES:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status, message=response.reason,
+                            )
+                        return json.loads(await response.text())
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.decoder.JSONDecodeError):
+                if attempt == self.max_retries - 1:
+                    raise
+                self.n_retries += 1
+                await asyncio.sleep(self.backoff(attempt))
@@ -1,20 +1,61 @@
-"""Скрипт для парсинга информации о ноутбуках, представленных в МВидео."""
+"""Скрипт для парсинга информации о ноутбуках, представленных в МВидео.
+
+Запросы выполняются асинхронно: страницы каталога и карточки ноутбуков
+загружаются параллельно через CrawlerClient, который ограничивает число
+одновременных запросов и их частоту к сайту и повторяет неудачные запросы.
+Загруженное сразу дописывается в журнал STATE_PATH, поэтому прерванный
+обход при повторном запуске продолжается с места остановки.
+"""
+import argparse
+import asyncio
 import math
+import os
 from typing import List, Dict, Union
 import mvideo_config as cfg
 
-import requests
+import aiohttp
 import json
 import pandas as pd
 from tqdm import tqdm
-import time
+
+from crawl_state import CrawlState
+from http_client import CrawlerClient
 
 RequestParams = Dict[str, Dict[str, Union[str, List[str]]]]
 
+BASE_URL = 'https://www.mvideo.ru'
+# Одновременных запросов к сайту
+MAX_CONCURRENCY = 8
+# Запросов в секунду к одному хосту и допустимая пачка запросов сверх этого
+REQUESTS_PER_SECOND = 10.0
+BURST = 10
+# Попыток на запрос, задержка между ними растет от BACKOFF_BASE до BACKOFF_MAX секунд
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Журнал прогресса, из которого прерванный обход продолжается
+STATE_PATH = 'crawl_state.jsonl'
+
+
+def with_params(request_parameters: RequestParams, **updates) -> RequestParams:
+    """Копия параметров запроса с обновленными разделами.
+
+    Запросы выполняются параллельно, поэтому общие параметры из конфига не
+    меняются, а каждый запрос получает свою копию.
+    :param request_parameters: параметры запроса из конфига
+    :param updates: раздел (params, json, headers) - словарь с новыми значениями
+    :return новые параметры запроса
+    """
+    return {
+        **request_parameters,
+        **{section: {**request_parameters.get(section, {}), **values} for section, values in updates.items()},
+    }
+
 
-def get_product_ids(
+async def get_product_ids(
     request_parameters: RequestParams,
-    session: requests.Session,
+    client: CrawlerClient,
+    state: CrawlState,
 ) -> Dict[int, List[str]]:
     """Функция выгрузки ID товаров.
 
@@ -22,40 +63,47 @@ def get_product_ids(
         ключ - номер страницы, на котором представлены ноутбуки
         значение - список ID ноутбуков, представленых на данной странице
     :param request_parameters: параметры запроса для получения информации
-    :param session: сессия запросов к АПИ МВидео
+    :param client: клиент запросов к АПИ МВидео
+    :param state: журнал прогресса, страницы из него повторно не запрашиваются
     :return словарь с номером страницы и списком ID представленных ноутбуков
     """
-    response = session.get('https://www.mvideo.ru/bff/products/listing', **request_parameters).json()
-
-    # Смотрим общее количество ноутбуков в магазине (на всех страницах)
-    n_notebooks = response.get('body').get('total')
-    # Рассчитаем сколько на одной странице представлено ноутбуков
-    notebooks_per_page = (
-        int(request_parameters['params']['limit'])
-        if int(request_parameters['params']['limit'])
-        else len(response.get('body').get('products'))
-    )
-    # Рассчитаем количество страниц, на которых представлены ноутбуки
-    n_web_pages = math.ceil(n_notebooks / notebooks_per_page)
+    if state.listing is None:
+        response = await client.request_json('GET', f'{BASE_URL}/bff/products/listing', **request_parameters)
 
-    # Инициализируем словарь, в котором будут все ID ноутбуков
-    products_ids_per_page = {}
+        # Смотрим общее количество ноутбуков в магазине (на всех страницах)
+        n_notebooks = response.get('body').get('total')
+        # Рассчитаем сколько на одной странице представлено ноутбуков
+        notebooks_per_page = (
+            int(request_parameters['params']['limit'])
+            if int(request_parameters['params']['limit'])
+            else len(response.get('body').get('products'))
+        )
+        # Рассчитаем количество страниц, на которых представлены ноутбуки
+        n_web_pages = math.ceil(n_notebooks / notebooks_per_page)
+        state.append('listing', {'pages': n_web_pages, 'per_page': notebooks_per_page})
+    n_web_pages, notebooks_per_page = state.listing['pages'], state.listing['per_page']
+
+    todo = [page_num for page_num in range(n_web_pages) if page_num not in state.pages]
+    progress = tqdm(total=n_web_pages, initial=n_web_pages - len(todo), desc='Сбор ID ноутбуков')
 
-    # Пробегаем по всем страницам, собираем ID ноутбуков
-    for page_num in tqdm(range(n_web_pages), desc='Сбор ID ноутбуков'):
+    async def get_page(page_num: int) -> None:
         # Рассчитываем оффсет - пангинацию
-        request_parameters['params']['offset'] = str(page_num * notebooks_per_page)
+        page_parameters = with_params(request_parameters, params={'offset': str(page_num * notebooks_per_page)})
+        page_response = await client.request_json('GET', f'{BASE_URL}/bff/products/listing', **page_parameters)
+        state.append('page', page_response.get('body').get('products'), page=page_num)
+        progress.update()
 
-        page_response = session.get('https://www.mvideo.ru/bff/products/listing', **request_parameters).json()
-        products_ids_per_page[page_num] = page_response.get('body').get('products')
-    return products_ids_per_page
+    # Пробегаем по всем страницам параллельно, собираем ID ноутбуков
+    await asyncio.gather(*(get_page(page_num) for page_num in todo))
+    progress.close()
+    return {page_num: state.pages[page_num] for page_num in range(n_web_pages)}
 
 
-def get_product_names(
+async def get_product_names(
         ids_on_page: List[str],
         page_num: int,
         request_parameters: RequestParams,
-        session: requests.Session,
+        client: CrawlerClient,
 ) -> Dict[str, str]:
     """Функция выгрузки названий товаров.
 
@@ -64,26 +112,26 @@ def get_product_names(
     :param ids_on_page: список ID ноутбуков на странице
     :param page_num: номер страницы, на которой представлены ноутбуки
     :param request_parameters: параметры запроса для получения информации
-    :param session: сессия запросов к АПИ МВидео
+    :param client: клиент запросов к АПИ МВидео
     :return словарь с парами ID - транслитерированное название
     """
     products_translit_name = {}
-    request_parameters['json']['productIds'] = ids_on_page
+    request_parameters = with_params(request_parameters, json={'productIds': ids_on_page})
     try:
-        response = session.post('https://www.mvideo.ru/bff/product-details/list', **request_parameters).json()
+        response = await client.request_json('POST', f'{BASE_URL}/bff/product-details/list', **request_parameters)
         products_info = response.get('body').get('products')
         for product in products_info:
             products_translit_name[product['productId']] = product['nameTranslit']
-    except json.decoder.JSONDecodeError:
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.decoder.JSONDecodeError):
         print(f"Could not parse notebook's names for page #{page_num}")
     return products_translit_name
 
 
-def get_product_prices(
+async def get_product_prices(
         ids_on_page: List[str],
         page_num: int,
         request_parameters: RequestParams,
-        session: requests.Session,
+        client: CrawlerClient,
 ) -> Dict[str, Dict[str, int]]:
     """Функция выгрузки цен товаров.
 
@@ -91,57 +139,54 @@ def get_product_prices(
     :param ids_on_page: список ID ноутбуков на странице
     :param page_num: номер страницы, на которой представлены ноутбуки
     :param request_parameters: параметры запроса для получения информации
-    :param session: сессия запросов к АПИ МВидео
+    :param client: клиент запросов к АПИ МВидео
     :return словарь с парами ID - словарь с различными типами цен
     """
     product_prices_per_id = {}
     price_fields = ['basePrice', 'basePromoPrice', 'salePrice']
-    request_parameters['params']['productIds'] = ','.join(ids_on_page)
+    request_parameters = with_params(request_parameters, params={'productIds': ','.join(ids_on_page)})
     try:
-        response = session.get('https://www.mvideo.ru/bff/products/prices', **request_parameters).json()
+        response = await client.request_json('GET', f'{BASE_URL}/bff/products/prices', **request_parameters)
         products_prices = response.get('body').get('materialPrices')
         for product in products_prices:
             product_prices_per_id[product['productId']] = {
                 price_type: product['price'][price_type] for price_type in price_fields
             }
-    except json.decoder.JSONDecodeError:
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.decoder.JSONDecodeError):
         print(f"Could not parse notebook's prices for page #{page_num}")
     return product_prices_per_id
 
 
-def get_product_characteristics(
+async def get_product_characteristics(
         product_id: str,
         product_name_translit: str,
         request_parameters: RequestParams,
-        session: requests.Session,
+        client: CrawlerClient,
 ) -> Dict[str, Dict[str, str]]:
     """Функция выгрузки характеристик ноутбуков.
 
     :param product_id: ID ноутбука
     :param product_name_translit: транслитерированное название ноутбука
     :param request_parameters: параметры запроса для получения информации
-    :param session: сессия запросов к АПИ МВидео
+    :param client: клиент запросов к АПИ МВидео
     :return словарь с парами ID - словарь с характеристиками ноутбука
     """
-    request_parameters['params'] = {'productId': product_id}
-    product_url = f'https://www.mvideo.ru/products/{product_name_translit}-{product_id}'
-    request_parameters['headers']['referer'] = product_url
-    for retry in range(5):
-        try:
-            response = session.get('https://www.mvideo.ru/bff/product-details', **request_parameters).json()
-            product_properties = response.get('body').get('properties').get('all')
-            product_parsed_stats = {
-                'brand_name': response.get('body').get('brandName'),
-                'url': product_url,
-            }
-            break
-        except json.decoder.JSONDecodeError:
-            if retry == 0:
-                print(f"ID {product_id} will retry after 40s sleep")
-                time.sleep(40)
-            if retry == 4:
-                print(f"ID {product_id} unsuccessful!")
-                return {product_id: {'url': product_url}}
+    product_url = f'{BASE_URL}/products/{product_name_translit}-{product_id}'
+    request_parameters = with_params(
+        request_parameters,
+        params={'productId': product_id},
+        headers={'referer': product_url},
+    )
+    try:
+        response = await client.request_json('GET', f'{BASE_URL}/bff/product-details', **request_parameters)
+        product_properties = response.get('body').get('properties').get('all')
+        product_parsed_stats = {
+            'brand_name': response.get('body').get('brandName'),
+            'url': product_url,
+        }
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.decoder.JSONDecodeError):
+        print(f"ID {product_id} unsuccessful!")
+        return {product_id: {'url': product_url}}
 
     for category in product_properties:
         for detail in category['properties']:
@@ -171,49 +216,140 @@ def prepare_raw_dataset(
     all_data.to_parquet('unfiltered_features.parquet')
 
 
-def main():
-    """Функция парсинга информации о ноутбуках МВидео."""
-    parser_session = requests.Session()
-    # Выгружаем список всех ноутбуков
-    product_ids_per_page = get_product_ids(cfg.product_ids_params, parser_session)
+async def get_page_info(
+        ids_on_page: List[str],
+        page_num: int,
+        client: CrawlerClient,
+        state: CrawlState,
+        progress: tqdm,
+) -> tuple:
+    """Функция выгрузки названий, цен и характеристик ноутбуков одной страницы.
 
-    all_notebooks_prices = {}
-    all_notebook_names = {}
-    all_notebook_stats = {}
+    Названия и цены запрашиваются одновременно, затем параллельно загружаются
+    характеристики всех ноутбуков страницы. Уже сохраненное в журнале
+    прогресса не запрашивается, а успешно загруженное сразу в него пишется.
+    Неудачные запросы в журнал не попадают и повторяются при следующем запуске.
+    :param ids_on_page: список ID ноутбуков на странице
+    :param page_num: номер страницы, на которой представлены ноутбуки
+    :param client: клиент запросов к АПИ МВидео
+    :param state: журнал прогресса
+    :param progress: прогресс-бар загрузки характеристик
+    :return названия, цены и характеристики ноутбуков страницы
+    """
+    async def get_names() -> Dict[str, str]:
+        if page_num not in state.names:
+            names = await get_product_names(ids_on_page, page_num, cfg.product_names_params, client)
+            if not names:
+                return names
+            state.append('names', names, page=page_num)
+        return state.names[page_num]
+
+    async def get_prices() -> Dict[str, Dict[str, int]]:
+        if page_num not in state.prices:
+            prices = await get_product_prices(ids_on_page, page_num, cfg.product_prices_params, client)
+            if not prices:
+                return prices
+            state.append('prices', prices, page=page_num)
+        return state.prices[page_num]
+
+    names, prices = await asyncio.gather(get_names(), get_prices())
 
-    # Проходим каждую страницу с ноутбуками
-    tqdm_info = tqdm(product_ids_per_page.items(), desc='Сбор названий и цен ноутбуков')
-    for page_num, ids_on_page in tqdm_info:
-        all_notebook_names.update(
-            get_product_names(ids_on_page, page_num, cfg.product_names_params, parser_session)
+    async def get_stats(product_id: str) -> Dict[str, Dict[str, str]]:
+        product_stats = await get_product_characteristics(
+            product_id=product_id,
+            product_name_translit=names.get(product_id, ''),
+            request_parameters=cfg.product_characteristics_params,
+            client=client,
         )
-        all_notebooks_prices.update(
-            get_product_prices(ids_on_page, page_num, cfg.product_prices_params, parser_session)
+        # При неудаче от ноутбука остается только ссылка
+        if 'brand_name' in product_stats[product_id]:
+            state.append('characteristics', product_stats)
+        progress.update()
+        return product_stats
+
+    # Для каждого ноутбука загружаем его характеристики
+    todo = [product_id for product_id in ids_on_page if product_id not in state.characteristics]
+    fetched = {}
+    for product_stats in await asyncio.gather(*(get_stats(product_id) for product_id in todo)):
+        fetched.update(product_stats)
+    stats = {
+        product_id: state.characteristics.get(product_id) or fetched[product_id]
+        for product_id in ids_on_page
+    }
+    return names, prices, stats
+
+
+async def crawl(state: CrawlState) -> Dict[str, dict]:
+    """Функция обхода каталога ноутбуков МВидео.
+
+    :param state: журнал прогресса, с которого продолжается обход
+    :return словари, которые сохраняются в json: имя файла - содержимое
+    """
+    async with CrawlerClient(
+        max_concurrency=MAX_CONCURRENCY,
+        rate=REQUESTS_PER_SECOND,
+        burst=BURST,
+        max_retries=MAX_RETRIES,
+        backoff_base=BACKOFF_BASE,
+        backoff_max=BACKOFF_MAX,
+    ) as client:
+        # Выгружаем список всех ноутбуков
+        product_ids_per_page = await get_product_ids(cfg.product_ids_params, client, state)
+
+        # Проходим все страницы с ноутбуками параллельно
+        all_ids = [product_id for ids_on_page in product_ids_per_page.values() for product_id in ids_on_page]
+        progress = tqdm(
+            total=len(all_ids),
+            initial=sum(product_id in state.characteristics for product_id in all_ids),
+            desc='Сбор названий, цен и характеристик ноутбуков',
         )
-        # Для каждого ноутбука загружаем его характеристики
-        for product_id in ids_on_page:
-            all_notebook_stats.update(
-                get_product_characteristics(
-                    product_id=product_id,
-                    product_name_translit=all_notebook_names[product_id],
-                    request_parameters=cfg.product_characteristics_params,
-                    session=parser_session,
-                )
-            )
-            time.sleep(0.1)
+        pages_info = await asyncio.gather(*(
+            get_page_info(ids_on_page, page_num, client, state, progress)
+            for page_num, ids_on_page in product_ids_per_page.items()
+        ))
+        progress.close()
+        print(f'Requests: {client.n_requests}, retries: {client.n_retries}')
 
-    # Сохраняем всю собранную информацию
-    json_names = {
+    all_notebooks_prices = {}
+    all_notebook_names = {}
+    all_notebook_stats = {}
+    # Собираем результаты в порядке страниц
+    for names, prices, stats in pages_info:
+        all_notebook_names.update(names)
+        all_notebooks_prices.update(prices)
+        all_notebook_stats.update(stats)
+    return {
         'all_products_ids_per_page': product_ids_per_page,
         'product_prices_per_id': all_notebooks_prices,
         'product_translit_names': all_notebook_names,
         'product_characteristics': all_notebook_stats,
     }
+
+
+def main():
+    """Функция парсинга информации о ноутбуках МВидео."""
+    parser = argparse.ArgumentParser(description='Парсинг ноутбуков МВидео')
+    parser.add_argument('--fresh', action='store_true', help='начать обход заново, удалив сохраненный прогресс')
+    args = parser.parse_args()
+    if args.fresh and os.path.exists(STATE_PATH):
+        os.remove(STATE_PATH)
+
+    state = CrawlState(STATE_PATH)
+    if state.n_records:
+        print(f'Resuming from {STATE_PATH}: {state.n_records} saved results')
+    try:
+        json_names = asyncio.run(crawl(state))
+    finally:
+        state.close()
+
+    # Сохраняем всю собранную информацию
     for file_name, data in json_names.items():
         with open(f'{file_name}.json', 'w', encoding='UTF-8') as file:
             json.dump(data, file, ensure_ascii=False, indent=4)
 
     prepare_raw_dataset('product_characteristics.json', 'product_prices_per_id.json')
+    # Обход завершен, следующий запуск начнет новый
+    state.remove()
 
 
 if __name__ == '__main__':
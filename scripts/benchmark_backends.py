@@ -0,0 +1,103 @@
+"""Compare the NGBoost and CatBoost serving backends on the latest scrape.
+
+For both backends the script measures the latency of single-record and
+whole-file predictions on the latest scrape, the mean width of the 95%
+interval (in log price and in rubles) and the share of real prices inside
+it. Width and coverage are measured on the rows the backend was not trained
+on: the validation products of train_model.py for NGBoost and the notebook
+hold-out split of build_catboost_calibration.py for CatBoost, the one its
+interval was calibrated on. The prediction cache and the price table are
+not used, every call goes to the model.
+"""
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+from loguru import logger
+
+import lambda_app
+from confidence_interval import get_ci
+from build_catboost_calibration import read_holdout
+from catboost_backend import CatBoostBackend
+from processed_dataset import PARTITION_COLUMN, PRODUCT_ID, list_scrape_dates, read_dataset
+from train_model import validation_mask
+
+DATA_PATH = "data/processed/clean_data"
+MODEL_PATH = "models/ngboost_serving"
+CATBOOST_MODEL_PATH = "models/cagboost_model.bin"
+CATBOOST_CALIBRATION_PATH = "models/catboost_calibration.json"
+N_SINGLE = int(os.environ.get("N_SINGLE", 500))
+
+
+def ngboost_interval(model, encoder):
+    def predict(records: list) -> np.array:
+        return get_ci(model, encoder.transform(records))[:, 1:]
+    return predict
+
+
+def catboost_interval(backend: CatBoostBackend):
+    def predict(records: list) -> np.array:
+        return backend.predict_interval(records)[:, 1:]
+    return predict
+
+
+def benchmark(name: str, predict, records: list, holdout_records: list, holdout_y: np.array) -> dict:
+    """Latency on records, interval width and coverage on the held-out rows"""
+    rng = random.Random(0)
+    single_ms = []
+    for _ in range(N_SINGLE):
+        record = rng.choice(records)
+        start = time.perf_counter()
+        predict([record])
+        single_ms.append((time.perf_counter() - start) * 1000)
+    single_ms.sort()
+
+    start = time.perf_counter()
+    predict(records)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    ci = predict(holdout_records)
+
+    return {
+        "backend": name,
+        "single_p50_ms": statistics.median(single_ms),
+        "single_p99_ms": single_ms[int(len(single_ms) * 0.99)],
+        "batch_ms": batch_ms,
+        "width_log": float(np.mean(ci[:, 1] - ci[:, 0])),
+        "width_rub": float(np.mean(np.expm1(ci[:, 1]) - np.expm1(ci[:, 0]))),
+        "coverage": float(np.mean((ci[:, 0] < holdout_y) & (holdout_y < ci[:, 1]))),
+        "holdout_rows": len(holdout_y),
+    }
+
+
+def main():
+    scrape_date = list_scrape_dates(DATA_PATH)[-1]
+    df = read_dataset(DATA_PATH, scrape_dates=[scrape_date])
+    records = df.drop(columns=["priceLog", PRODUCT_ID, PARTITION_COLUMN]).to_dict(orient="records")
+    logger.info(f"Benchmarking on {len(records)} rows of {DATA_PATH}, scrape date {scrape_date}")
+    ngboost_holdout = df[validation_mask(df[PRODUCT_ID])].drop(columns=[PRODUCT_ID, PARTITION_COLUMN])
+    catboost_holdout = read_holdout(DATA_PATH)
+
+    model, encoder = lambda_app.read_model(MODEL_PATH)
+    backend = CatBoostBackend.load(CATBOOST_MODEL_PATH, CATBOOST_CALIBRATION_PATH)
+    results = [
+        benchmark("ngboost", ngboost_interval(model, encoder), records,
+                  ngboost_holdout.drop(columns="priceLog").to_dict(orient="records"),
+                  ngboost_holdout["priceLog"].to_numpy()),
+        benchmark("catboost", catboost_interval(backend), records,
+                  catboost_holdout.drop(columns="priceLog").to_dict(orient="records"),
+                  catboost_holdout["priceLog"].to_numpy()),
+    ]
+    for result in results:
+        logger.info(
+            f"{result['backend']:>8}: single p50 {result['single_p50_ms']:.3f} ms, "
+            f"p99 {result['single_p99_ms']:.3f} ms, {len(records)} rows {result['batch_ms']:.1f} ms, "
+            f"interval width {result['width_log']:.3f} log / {result['width_rub']:.0f} rub, "
+            f"coverage {result['coverage']:.3f} on {result['holdout_rows']} held-out rows"
+        )
+
+
+if __name__ == "__main__":
+    main()
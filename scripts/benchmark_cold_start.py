@@ -0,0 +1,72 @@
+"""Cold start benchmark for the Lambda handler.
+
+Each run starts a fresh interpreter, imports lambda_app and calls the handler
+once, which is what a Lambda cold start does. The script fails if the median
+cold start exceeds COLD_START_BUDGET_MS.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from loguru import logger
+
+MODEL_PATH = "models/ngboost_serving"
+N_RUNS = int(os.environ.get("N_RUNS", 10))
+COLD_START_BUDGET_MS = float(os.environ.get("COLD_START_BUDGET_MS", 400))
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, "scripts")
+import lambda_app
+imported = time.perf_counter()
+lambda_app.handler({
+    'brand_name': 'lenovo', 'proc_freq': 1.2, 'proc_brand': 'amd', 'proc_name': 'amd',
+    'proc_count': 2.0, 'videocard': 'radeon', 'videocard_memory': 8.0, 'screen': 11.0,
+    'ssd_volume': 0, 'ram': 4, 'hdmi': True, 'material': 'пластик', 'battery_life': 8.0,
+}, None)
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_call_ms": (done - imported) * 1000,
+    "import_breakdown_ms": {name: s * 1000 for name, s in lambda_app.IMPORT_TIMES.items()},
+    "modules": sorted(name for name in ("ngboost", "sklearn", "scipy", "loguru") if name in sys.modules),
+}))
+"""
+
+
+def run_cold_start() -> dict:
+    """Invoke the handler once in a fresh interpreter"""
+    env = dict(os.environ, MODEL_PATH=MODEL_PATH, LOG_LEVEL="WARNING")
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    result["total_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    logger.info(f"Running {N_RUNS} cold starts with model {MODEL_PATH}")
+    runs = [run_cold_start() for _ in range(N_RUNS)]
+
+    for key in ("total_ms", "import_ms", "first_call_ms"):
+        logger.info(f"median {key}: {statistics.median(run[key] for run in runs):.1f}")
+    for name in runs[0]["import_breakdown_ms"]:
+        logger.info(f"median import of {name}: {statistics.median(run['import_breakdown_ms'][name] for run in runs):.1f} ms")
+    if runs[0]["modules"]:
+        logger.warning(f"Heavy modules imported by the handler: {runs[0]['modules']}")
+
+    median_total = statistics.median(run["total_ms"] for run in runs)
+    if median_total > COLD_START_BUDGET_MS:
+        logger.error(f"Cold start {median_total:.1f} ms exceeds budget of {COLD_START_BUDGET_MS:.0f} ms")
+        sys.exit(1)
+    logger.success(f"Cold start {median_total:.1f} ms is within budget of {COLD_START_BUDGET_MS:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Residual-quantile calibration table for the CatBoost backend.
+
+The residuals y - prediction are taken on the rows held out in
+notebooks/model_selection_2.ipynb (the same split and seed), and for every
+confidence level the table keeps the residual quantiles at (1 - level) / 2
+and (1 + level) / 2, which the backend adds to its predictions.
+
+The notebook trained the model on clean_data.csv of the SCRAPE_DATE scrape,
+so the held-out rows can only be reproduced on that partition of the
+processed dataset: its rows come in the same order as in the CSV. A model
+retrained on a later scrape needs SCRAPE_DATE updated with it.
+"""
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sklearn.model_selection import train_test_split
+
+from catboost_backend import CatBoostBackend, file_sha256
+from processed_dataset import PARTITION_COLUMN, PRODUCT_ID, list_scrape_dates, read_dataset
+
+logger.add("logs/catboost_calibration.log", format="{time} {level} {message}", level="INFO", rotation="10 MB")
+
+DATA_PATH = "data/processed/clean_data"
+# Scrape the CatBoost model was trained on in the notebook
+SCRAPE_DATE = "2022-12-04"
+MODEL_PATH = "models/cagboost_model.bin"
+CALIBRATION_PATH = "models/catboost_calibration.json"
+LEVELS = [0.68, 0.95]
+SEED = 42
+
+
+def residual_quantiles(residuals: np.array, levels: list) -> dict:
+    return {
+        str(level): np.quantile(residuals, [(1 - level) / 2, (1 + level) / 2]).tolist()
+        for level in levels
+    }
+
+
+def read_holdout(data_path: str = DATA_PATH) -> pd.DataFrame:
+    """Rows of the SCRAPE_DATE scrape the CatBoost model was not trained on"""
+    if SCRAPE_DATE not in list_scrape_dates(data_path):
+        raise ValueError(f"{data_path} has no scrape {SCRAPE_DATE} the model was trained on")
+    df = read_dataset(data_path, scrape_dates=[SCRAPE_DATE]).drop(columns=[PRODUCT_ID, PARTITION_COLUMN])
+    _, df_holdout = train_test_split(df, shuffle=True, random_state=SEED)
+    return df_holdout
+
+
+def main():
+    from catboost import CatBoostRegressor
+
+    model = CatBoostRegressor()
+    model.load_model(MODEL_PATH)
+    backend = CatBoostBackend(model, calibration={})
+
+    df_holdout = read_holdout()
+    records = df_holdout.drop("priceLog", axis=1).to_dict(orient="records")
+    residuals = df_holdout["priceLog"].to_numpy() - backend.predict(records)
+    logger.info(f"Residuals on {len(residuals)} held-out rows: RMSE {np.sqrt(np.mean(residuals ** 2)):.5f}")
+
+    levels = residual_quantiles(residuals, LEVELS)
+    for level, (lower, upper) in levels.items():
+        logger.info(f"{float(level):.0%} interval: prediction {lower:+.4f} .. {upper:+.4f}")
+    with open(CALIBRATION_PATH, "w", encoding="UTF-8") as f:
+        json.dump({
+            "model_sha256": file_sha256(MODEL_PATH),
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "scrape_date": SCRAPE_DATE,
+            "rows": len(residuals),
+            "levels": levels,
+        }, f, indent=4)
+    logger.success(f"Calibration table saved to {CALIBRATION_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Precompute price ranges for the answers offered by the telegram bot.
+
+The grid mirrors the menus in telegram_bot/possible_answers.py, already
+mapped to model features, plus the most common values of the numbers the
+bot asks for. Every grid cell is scored with the serving model in
+vectorised batches and saved as a PriceTable next to the model artifact.
+"""
+import numpy as np
+from loguru import logger
+
+from confidence_interval import LEVEL, intervals
+from model_artifact import load_artifact
+from price_table import PRICE_DTYPE, PriceTable
+
+logger.add("logs/price_table.log", format="{time} {level} {message}", level="INFO", rotation="10 MB")
+
+MODEL_PATH = "models/ngboost_serving"
+TABLE_PATH = "models/price_table"
+BATCH_SIZE = 50_000
+
+VIDEOCARD_MEMORY_GB = [2, 4, 8]
+GRID_AXES = [
+    {"fields": ["brand_name"], "values": [["apple"], ["hp"], ["msi"], ["acer"], ["lenovo"], ["asus"], ["other"]]},
+    {"fields": ["proc_brand", "proc_name"], "values": [
+        ["apple", "apple m1"],
+        ["apple", "apple m2"],
+        ["intel", "intel core i3"],
+        ["intel", "intel core i5"],
+        ["intel", "intel core i7"],
+        ["intel", "intel pentium"],
+        ["intel", "intel celeron"],
+        ["intel", "intel"],
+        ["zhaoxin", "zhaoxin"],
+        ["qualcomm", "qualcomm"],
+        ["amd", "amd ryzen"],
+        ["other", "other"],
+    ]},
+    {"fields": ["proc_count"], "values": [[2], [4], [6], [8]]},
+    {"fields": ["videocard", "videocard_memory"], "values": [["интегрированная", 0]] + [
+        [videocard, memory]
+        for videocard in ["geforce rtx", "geforce mx", "geforce gtx", "radeon", "other"]
+        for memory in VIDEOCARD_MEMORY_GB
+    ]},
+    {"fields": ["screen"], "values": [[13], [14], [15], [16]]},
+    {"fields": ["ssd_volume"], "values": [[256], [512], [1024]]},
+    {"fields": ["ram"], "values": [[8], [16], [32]]},
+    {"fields": ["hdmi"], "values": [[True], [False]]},
+    {"fields": ["material"], "values": [["металл"], ["пластик"]]},
+    {"fields": ["battery_life"], "values": [[6], [8], [10]]},
+]
+
+
+def get_axis_columns(encoder, axes: list) -> list:
+    """Encoded contribution of every value combination, one matrix per axis"""
+    return [
+        encoder.transform([dict(zip(axis["fields"], values)) for values in axis["values"]])
+        for axis in axes
+    ]
+
+
+def score_grid(model, axis_columns: list, shape: tuple) -> np.array:
+    """Predict price ranges for every grid cell, in row-major cell order"""
+    n_cells = int(np.prod(shape))
+    prices = np.empty(n_cells, dtype=PRICE_DTYPE)
+    for start in range(0, n_cells, BATCH_SIZE):
+        cells = np.arange(start, min(start + BATCH_SIZE, n_cells))
+        # Axes encode disjoint columns, so a cell is the sum of its axis rows
+        X = sum(columns[pos] for columns, pos in zip(axis_columns, np.unravel_index(cells, shape)))
+        ci = np.expm1(intervals(model.pred_param(X), (LEVEL,)))
+        prices["min_price"][cells] = ci[:, 1]
+        prices["max_price"][cells] = ci[:, 2]
+        logger.info(f"Scored {cells[-1] + 1} / {n_cells} cells")
+    return prices
+
+
+def main():
+    logger.info(f"Reading model from {MODEL_PATH}")
+    model, encoder = load_artifact(MODEL_PATH)
+
+    shape = tuple(len(axis["values"]) for axis in GRID_AXES)
+    logger.info(f"Grid shape {shape}, {int(np.prod(shape))} cells")
+    prices = score_grid(model, get_axis_columns(encoder, GRID_AXES), shape)
+
+    table = PriceTable(GRID_AXES, prices, model.version, LEVEL)
+    table.save(TABLE_PATH)
+    logger.success(f"Price table saved to {TABLE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""CatBoost point predictions with intervals from a calibration table.
+
+CatBoost predicts only the log price. The interval around it is taken from
+quantiles of the residuals y - prediction on held-out rows, precomputed per
+confidence level by build_catboost_calibration.py:
+    {"model_sha256": ..., "levels": {"0.95": [lower, upper], ...}}
+
+catboost is imported when a model is loaded, so serving that never asks for
+this backend doesn't pay for the import.
+"""
+import hashlib
+import json
+import math
+from numbers import Number
+from typing import List, Sequence
+
+import numpy as np
+
+LEVEL = 0.95
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CatBoostBackend:
+    def __init__(self, model, calibration: dict):
+        self.model = model
+        self.calibration = calibration
+        self.feature_names = list(model.feature_names_)
+        self.cat_features = frozenset(self.feature_names[idx] for idx in model.get_cat_feature_indices())
+
+    @classmethod
+    def load(cls, model_path: str, calibration_path: str) -> "CatBoostBackend":
+        from catboost import CatBoostRegressor
+
+        model = CatBoostRegressor()
+        model.load_model(model_path)
+        with open(calibration_path, encoding="UTF-8") as f:
+            calibration = json.load(f)
+        if calibration["model_sha256"] != file_sha256(model_path):
+            raise ValueError(f"Calibration {calibration_path} was built for another model than {model_path}")
+        return cls(model, calibration)
+
+    def to_rows(self, records: List[dict]) -> list:
+        """Feature rows in the model order, missing numbers are NaN and missing categories "None\""""
+        rows = []
+        for record in records:
+            row = []
+            for name in self.feature_names:
+                value = record.get(name)
+                if name in self.cat_features:
+                    row.append(str(value))
+                elif isinstance(value, Number):
+                    row.append(float(value))
+                elif value is None:
+                    row.append(math.nan)
+                else:
+                    raise TypeError(f"Unsupported value type {type(value)} for feature {name}")
+            rows.append(row)
+        return rows
+
+    def predict(self, records: List[dict]) -> np.array:
+        """Log price predictions for a list of feature dicts"""
+        return np.asarray(self.model.predict(self.to_rows(records), thread_count=1))
+
+    def predict_interval(self, records: List[dict], levels: Sequence[float] = (LEVEL,)) -> np.array:
+        """(mean, lower_1, upper_1, lower_2, upper_2, ...) of the log price per record and level"""
+        missing = [level for level in levels if str(level) not in self.calibration["levels"]]
+        if missing:
+            raise ValueError(f"No calibration for levels {missing}, calibrated: {sorted(self.calibration['levels'])}")
+        offsets = np.array([self.calibration["levels"][str(level)] for level in levels]).ravel()
+        preds = self.predict(records)
+        return np.c_[preds, preds[:, None] + offsets]
@@ -0,0 +1,42 @@
+"""Confidence intervals of the log price from NGBoost Normal parameters.
+
+pred_param returns (loc, log scale) per row. For every requested level the
+interval is loc -/+ z * scale with z the two-sided Normal quantile of that
+level, e.g. 1.96 for 95% and 0.99 for 68%. All levels are computed in one
+pass over the batch, so the model is called once however many ranges are
+needed. The result has the mean in column 0 followed by the (lower, upper)
+pair of every level in the requested order:
+    [mean, lower_1, upper_1, lower_2, upper_2, ...]
+
+Only numpy and the standard library are imported, so serving can use it.
+"""
+from statistics import NormalDist
+from typing import Sequence
+
+import numpy as np
+
+LEVEL = 0.95
+
+
+def z_scores(levels: Sequence[float]) -> np.array:
+    """Two-sided standard Normal quantiles of the confidence levels"""
+    for level in levels:
+        if not 0 < level < 1:
+            raise ValueError(f"Confidence level must be between 0 and 1, got {level}")
+    return np.array([NormalDist().inv_cdf((1 + level) / 2) for level in levels])
+
+
+def intervals(preds: np.array, levels: Sequence[float] = (LEVEL,)) -> np.array:
+    """Mean and interval bounds for every level from pred_param output"""
+    mean = preds[:, 0]
+    half_widths = np.exp(preds[:, 1])[:, None] * z_scores(levels)
+    ci = np.empty((len(preds), 1 + 2 * len(levels)))
+    ci[:, 0] = mean
+    ci[:, 1::2] = mean[:, None] - half_widths
+    ci[:, 2::2] = mean[:, None] + half_widths
+    return ci
+
+
+def get_ci(model, X: np.array, levels: Sequence[float] = (LEVEL,)) -> np.array:
+    """Get predictions and confidence intervals for X with one model call"""
+    return intervals(model.pred_param(X), levels)
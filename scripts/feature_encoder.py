@@ -0,0 +1,63 @@
+from numbers import Number
+from typing import Dict, List, Union
+
+import numpy as np
+
+Record = Dict[str, Union[str, Number]]
+
+
+class FeatureEncoder:
+    """Drop-in replacement for a fitted DictVectorizer(sparse=False).transform.
+
+    String values are one-hot encoded as "<field><separator><value>" and
+    numbers (including bools, None as NaN) go to the column named after the
+    field, exactly like DictVectorizer. All column lookups are resolved once
+    from the vocabulary and rows are written straight into a preallocated
+    array.
+    """
+
+    def __init__(self, feature_names: List[str], separator: str = "="):
+        self.feature_names = list(feature_names)
+        self.separator = separator
+        self.numeric_columns = {}
+        self.one_hot_columns = {}
+        for idx, name in enumerate(self.feature_names):
+            field, sep, value = name.partition(separator)
+            if sep:
+                self.one_hot_columns[(field, value)] = idx
+            else:
+                self.numeric_columns[name] = idx
+
+    @classmethod
+    def from_vectorizer(cls, dv) -> "FeatureEncoder":
+        return cls(dv.feature_names_, dv.separator)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_names)
+
+    @property
+    def fields(self) -> frozenset:
+        """Record fields that make it into the encoded row"""
+        return frozenset(self.numeric_columns) | frozenset(field for field, _ in self.one_hot_columns)
+
+    def transform(self, records: Union[Record, List[Record]]) -> np.array:
+        """Encode one record or a list of records into a (rows, features) array"""
+        if isinstance(records, dict):
+            records = [records]
+        X = np.zeros((len(records), self.n_features))
+        numeric_columns, one_hot_columns = self.numeric_columns, self.one_hot_columns
+        for row, record in zip(X, records):
+            for field, value in record.items():
+                if isinstance(value, str):
+                    idx = one_hot_columns.get((field, value))
+                    if idx is not None:
+                        row[idx] = 1.0
+                elif isinstance(value, Number) or value is None:
+                    idx = numeric_columns.get(field)
+                    if idx is not None:
+                        # DictVectorizer encodes a missing number as NaN
+                        row[idx] = np.nan if value is None else float(value)
+                else:
+                    raise TypeError(f"Unsupported value type {type(value)} for feature {field}")
+        return X
@@ -0,0 +1,96 @@
+import numpy as np
+
+ROWS_PER_CHUNK = 256
+
+
+class FlatNGBoost:
+    """NGBoost ensemble flattened into contiguous node arrays.
+
+    Every base learner tree is stored in the same set of 1-d arrays. Tree t
+    starts at node roots[t], children are global node indices and leaves
+    point to themselves, so walking max_depth levels for all trees at once
+    lands every (row, tree) pair on its leaf.
+    """
+
+    ARRAYS = ("init_params", "scalings", "roots", "feature", "threshold", "left", "right", "value")
+
+    def __init__(self, init_params, learning_rate, scalings, roots,
+                 feature, threshold, left, right, value, max_depth, n_features, version=None):
+        # Arrays are kept as given so memory-mapped arrays stay memory-mapped
+        self.init_params = init_params
+        self.learning_rate = float(learning_rate)
+        self.scalings = scalings
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.version = version
+
+    @property
+    def n_params(self) -> int:
+        return len(self.init_params)
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.scalings)
+
+    @classmethod
+    def from_ngboost(cls, model) -> "FlatNGBoost":
+        """Flatten the base learners of a fitted NGBRegressor"""
+        roots, feature, threshold, left, right, value = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for models, col_idx in zip(model.base_models, model.col_idxs):
+            col_idx = np.asarray(col_idx)
+            for learner in models:
+                tree = learner.tree_
+                is_leaf = tree.children_left == -1
+                nodes = np.arange(tree.node_count)
+                roots.append(offset)
+                # Tree features index the column subsample, map them back to X
+                feature.append(np.where(is_leaf, 0, col_idx[np.maximum(tree.feature, 0)]))
+                threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+                left.append(offset + np.where(is_leaf, nodes, tree.children_left))
+                right.append(offset + np.where(is_leaf, nodes, tree.children_right))
+                value.append(tree.value[:, 0, 0])
+                max_depth = max(max_depth, tree.max_depth)
+                offset += tree.node_count
+        return cls(
+            init_params=np.asarray(model.init_params, dtype=np.float64),
+            learning_rate=model.learning_rate,
+            scalings=np.asarray(model.scalings, dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            feature=np.concatenate(feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.int32),
+            right=np.concatenate(right).astype(np.int32),
+            value=np.concatenate(value).astype(np.float64),
+            max_depth=max_depth,
+            n_features=model.n_features,
+        )
+
+    def _leaf_values(self, X: np.array) -> np.array:
+        """Leaf value of every tree for every row, shape (rows, trees)"""
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node]
+
+    def pred_param(self, X: np.array) -> np.array:
+        """Same result as NGBRegressor.pred_param, all trees evaluated at once"""
+        # sklearn trees compare float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        params = np.empty((len(X), self.n_params))
+        for start in range(0, len(X), ROWS_PER_CHUNK):
+            chunk = X[start:start + ROWS_PER_CHUNK]
+            resids = self._leaf_values(chunk).reshape(len(chunk), self.n_estimators, self.n_params)
+            params[start:start + ROWS_PER_CHUNK] = (
+                self.init_params - self.learning_rate * np.einsum("rip,i->rp", resids, self.scalings)
+            )
+        return params
@@ -1,36 +1,270 @@
-import pickle
-from ngboost import NGBRegressor
-from loguru import logger
+import logging
+import os
+import time
+
+# Import time of everything the handler needs, reported on the first call.
+# Serving imports only numpy and the artifact modules: no ngboost, sklearn
+# or loguru, which together dominated the cold start.
+_import_start = time.perf_counter()
 import numpy as np
+_numpy_imported = time.perf_counter()
+from confidence_interval import get_ci
+from feature_encoder import FeatureEncoder
+from flat_trees import FlatNGBoost
+from model_artifact import load_artifact
+from prediction_cache import PredictionCache
+from price_table import PriceTable
+IMPORT_TIMES = {
+    "numpy": _numpy_imported - _import_start,
+    "model modules": time.perf_counter() - _numpy_imported,
+}
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "model")
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", 4096))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 3600))
+PRICE_TABLE_PATH = os.environ.get("PRICE_TABLE_PATH", "price_table")
+PREPROCESSOR_PATH = os.environ.get("PREPROCESSOR_PATH", "preprocessor.json")
+CATBOOST_MODEL_PATH = os.environ.get("CATBOOST_MODEL_PATH", "catboost_model.bin")
+CATBOOST_CALIBRATION_PATH = os.environ.get("CATBOOST_CALIBRATION_PATH", "catboost_calibration.json")
+DEFAULT_BACKEND = os.environ.get("DEFAULT_BACKEND", "ngboost")
+# Confidence levels of the returned price ranges, the first one is min_price / max_price
+CI_LEVELS = tuple(float(level) for level in os.environ.get("CI_LEVELS", "0.95").split(","))
+# Records may pick the model that scores them with this field
+BACKEND_FIELD = "backend"
+BACKENDS = ("ngboost", "catboost")
+# Scraped fields of a raw shop record, as in prepare_data.RAW_COLUMNS (kept here to avoid importing pandas).
+# A record with any of them that isn't also a model feature is cleaned by the preprocessor.
+RAW_FIELDS = frozenset([
+    "brand_name",
+    "basePrice",
+    "Процессор_Процессор",
+    "Процессор_Количество ядер",
+    "Видеокарта_Графический контроллер",
+    "Экран_Диагональ экрана",
+    "Жесткий диск_Объем SSD",
+    "Оперативная память_Оперативная память (RAM)",
+    "Интерфейсы_Выход HDMI",
+    "Корпус_Материал корпуса",
+    "Электропитание_Работа от аккумулятора",
+])
+
+logger = logging.getLogger("lambda_app")
+
+# Models loaded in this container, keyed by path. Lambda keeps module state
+# between warm invocations, so the artifact is only read on a cold start.
+_loaded_models = {}
+# Precomputed price tables by path, None when absent or built for another model
+_price_tables = {}
+# Fitted preprocessors for raw shop records by path
+_preprocessors = {}
+# CatBoost backends by model path, loaded on the first request for them
+_catboost_backends = {}
+# Price ranges keyed by the encoded feature vector, shared across invocations
+_prediction_cache = PredictionCache(max_size=CACHE_SIZE, ttl_seconds=CACHE_TTL_SECONDS)
+
+
+def configure_logging() -> None:
+    """Set up logging on the first invocation instead of at import time"""
+    if not logging.getLogger().handlers:
+        # The Lambda runtime installs a root handler, plain interpreters don't
+        logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    logger.setLevel(LOG_LEVEL)
+
+
+def read_model(path: str):
+    return load_artifact(path)
+
+
+def validate_model(model: FlatNGBoost, encoder: FeatureEncoder) -> None:
+    """Check that the flat model and feature encoder fit together"""
+    if not model.n_estimators:
+        raise ValueError("Loaded flat model has no trees")
+    if model.n_features != encoder.n_features:
+        raise ValueError(
+            f"Model expects {model.n_features} features, "
+            f"encoder produces {encoder.n_features}"
+        )
+
+
+def get_model(path: str = MODEL_PATH):
+    """Return (model, encoder) for path, loading it once per container"""
+    if path not in _loaded_models:
+        start = time.perf_counter()
+        model, encoder = read_model(path)
+        load_time = time.perf_counter() - start
+        validate_model(model, encoder)
+        _loaded_models[path] = (model, encoder)
+        imports = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in IMPORT_TIMES.items())
+        logger.info(f"Cold start: imports took {imports}; model loaded from {path} in {load_time * 1000:.1f} ms")
+    return _loaded_models[path]
+
+
+def get_price_table(path: str, model_version: str):
+    """Return the price table for the served model, or None if there is none"""
+    if path not in _price_tables:
+        table = None
+        if os.path.isdir(path):
+            table = PriceTable.load(path)
+            if table.model_version != model_version:
+                logger.warning(f"Price table {path} was built for model {table.model_version}, ignoring it")
+                table = None
+            elif (table.level,) != CI_LEVELS:
+                logger.warning(f"Price table {path} has {table.level:.0%} ranges, {CI_LEVELS} requested, ignoring it")
+                table = None
+            else:
+                logger.info(f"Price table loaded from {path}: {len(table)} cells")
+        _price_tables[path] = table
+    return _price_tables[path]
+
+
+def get_preprocessor(path: str):
+    """Return the fitted preprocessor, imported and loaded on first use"""
+    if path not in _preprocessors:
+        # pandas is only needed for raw shop records, keep it out of the cold start
+        start = time.perf_counter()
+        from prepare_data import Preprocessor
+        _preprocessors[path] = Preprocessor.load(path)
+        logger.info(f"Preprocessor loaded from {path} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return _preprocessors[path]
 
-MODEL_PATH = "model.pkl"
 
-def read_model(path: str) -> NGBRegressor:
-    with open(path, "rb") as f:
-        model, dv = pickle.load(f)
-    return model, dv
+def get_catboost_backend(model_path: str, calibration_path: str):
+    """Return the CatBoost backend, imported and loaded on first use"""
+    if model_path not in _catboost_backends:
+        # catboost is a heavy import, only requests for this backend pay for it
+        start = time.perf_counter()
+        from catboost_backend import CatBoostBackend
+        _catboost_backends[model_path] = CatBoostBackend.load(model_path, calibration_path)
+        logger.info(f"CatBoost backend loaded from {model_path} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return _catboost_backends[model_path]
 
-def get_ci(model: NGBRegressor, X: np.array) -> np.array:
-    """Get predictions, and 95% confidence interval for X"""
-    z_score = 1.95  # 95% confidence interval
-    preds = model.pred_param(X)
-    mean = preds[:, 0]
-    lower = preds[:, 0] - z_score * np.exp(preds[:, 1])
-    upper = preds[:, 0] + z_score * np.exp(preds[:, 1])
-    return np.c_[lower, upper]
 
+def preprocess_records(encoder: FeatureEncoder, records: list) -> list:
+    """Turn raw shop records into model features.
 
-def handler(event, context) -> dict:
+    A record is raw if it has scraped fields (RAW_FIELDS) the model doesn't
+    know. Other unknown fields are ignored, as before. A record that mixes
+    scraped fields with model-only features is rejected, it is unclear which
+    of them should be used.
+    """
+    fields = encoder.fields
+    raw_only, features_only = RAW_FIELDS - fields, fields - RAW_FIELDS
+    raw = []
+    for idx, record in enumerate(records):
+        if record.keys() & raw_only:
+            mixed = record.keys() & features_only
+            if mixed:
+                raise ValueError(f"Record {idx} mixes raw shop fields with model features {sorted(mixed)}")
+            raw.append(idx)
+    if not raw:
+        return records
+    features = get_preprocessor(PREPROCESSOR_PATH).transform_records([records[idx] for idx in raw])
+    records = list(records)
+    for idx, record in zip(raw, features):
+        records[idx] = record
+    return records
+
+
+def price_ranges(bounds: list) -> dict:
+    """Result of one record from its (lower, upper) prices for every level of CI_LEVELS"""
+    result = {"min_price": bounds[0], "max_price": bounds[1]}
+    if len(CI_LEVELS) > 1:
+        result["ranges"] = {
+            str(level): {"min_price": bounds[2 * pos], "max_price": bounds[2 * pos + 1]}
+            for pos, level in enumerate(CI_LEVELS)
+        }
+    return result
+
+
+def predict_batch(model: FlatNGBoost, encoder: FeatureEncoder, records: list,
+                  price_table: PriceTable = None) -> list:
+    """Predict price ranges for a list of feature dicts in one model call.
+
+    Records on the precomputed price table grid are answered from it, the
+    rest are looked up in the prediction cache and only cache misses are
+    passed to the model.
+    """
+    results = [None] * len(records)
+    if price_table is not None:
+        results = [price_table.lookup(record) for record in records]
+    todo = [idx for idx, result in enumerate(results) if result is None]
+    if not todo:
+        return results
+
+    X = encoder.transform([records[idx] for idx in todo])
+    keys = [row.tobytes() for row in X]
+    prices = [_prediction_cache.get(model.version, key) for key in keys]
+    missing = [pos for pos, price in enumerate(prices) if price is None]
+    if missing:
+        unlog_ci = np.expm1(get_ci(model, X[missing], CI_LEVELS)[:, 1:])
+        for pos, price in zip(missing, unlog_ci.tolist()):
+            prices[pos] = tuple(price)
+            _prediction_cache.put(model.version, keys[pos], prices[pos])
+    for idx, bounds in zip(todo, prices):
+        results[idx] = price_ranges(bounds)
+    return results
+
+
+def predict_catboost(backend, records: list) -> list:
+    """Predict price ranges for a list of feature dicts with the CatBoost backend"""
+    unlog_ci = np.expm1(backend.predict_interval(records, CI_LEVELS)[:, 1:])
+    return [price_ranges(bounds) for bounds in unlog_ci.tolist()]
+
+
+def split_backends(records: list) -> tuple:
+    """Backend of every record and the records without the backend field"""
+    backends = [record.get(BACKEND_FIELD, DEFAULT_BACKEND) for record in records]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        raise ValueError(f"Unknown backends {sorted(unknown)}, expected one of {BACKENDS}")
+    records = [
+        {field: value for field, value in record.items() if field != BACKEND_FIELD} if BACKEND_FIELD in record
+        else record
+        for record in records
+    ]
+    return backends, records
+
+
+def handler(event, context):
+    """Predict a price range for one feature dict or a list of them.
+
+    Raw shop records (scraped field names) are cleaned by the fitted
+    preprocessor first. A record with "backend": "catboost" is scored by
+    the CatBoost backend instead of NGBoost.
+    """
+    cold_start = MODEL_PATH not in _loaded_models
+    if cold_start:
+        configure_logging()
     logger.info("Start predicting")
-    logger.info("Reading the model")
-    model, dv = read_model(MODEL_PATH)
-
-    X = dv.transform(event)
-    logger.info(f"data to predict: {event}")
-    ci = get_ci(model, X)
-    unlog_ci = np.expm1(ci)
-    logger.info(f"Predicted price range: {unlog_ci[0,0]:.2f} - {{unlog_ci[0,1]:.2f}}")
-    return {
-        "min_price": unlog_ci[0,0],
-        "max_price": unlog_ci[0,1]
-    }
\ No newline at end of file
+    model, encoder = get_model(MODEL_PATH)
+    price_table = get_price_table(PRICE_TABLE_PATH, model.version)
+
+    is_batch = isinstance(event, list)
+    records = event if is_batch else [event]
+    if len(records) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch of {len(records)} records exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}")
+
+    if not is_batch:
+        logger.info(f"data to predict: {event}")
+    start = time.perf_counter()
+    backends, records = split_backends(records)
+    records = preprocess_records(encoder, records)
+    results = [None] * len(records)
+    for name in set(backends):
+        idxs = [idx for idx, backend in enumerate(backends) if backend == name]
+        backend_records = [records[idx] for idx in idxs]
+        if name == "catboost":
+            catboost_backend = get_catboost_backend(CATBOOST_MODEL_PATH, CATBOOST_CALIBRATION_PATH)
+            backend_results = predict_catboost(catboost_backend, backend_records)
+        else:
+            backend_results = predict_batch(model, encoder, backend_records, price_table)
+        for idx, result in zip(idxs, backend_results):
+            results[idx] = result
+    predict_time = time.perf_counter() - start
+    if not is_batch:
+        logger.info(f"Predicted price range: {results[0]['min_price']:.2f} - {results[0]['max_price']:.2f}")
+    logger.info(f"Prediction of {len(records)} records took {predict_time * 1000:.1f} ms (cold start: {cold_start})")
+    logger.info(f"Prediction cache: {_prediction_cache.stats()}")
+    return results if is_batch else results[0]
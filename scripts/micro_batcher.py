@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Callable, List
+
+
+def _set_result(future: asyncio.Future, result) -> None:
+    # The caller may be gone already, e.g. the client disconnected
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exception: Exception) -> None:
+    if not future.done():
+        future.set_exception(exception)
+
+
+class MicroBatcher:
+    """Merges concurrent prediction requests into one vectorised model call.
+
+    A request waits at most window_ms for others to arrive, or less if
+    max_rows records have been collected. A batch never grows past
+    max_batch_rows, the most predict_fn accepts: a request that doesn't fit
+    starts the next batch instead. The merged batch goes to
+    predict_fn(list of records) -> list of results in the executor and every
+    caller gets its own slice back. At most max_in_flight batches run at once,
+    requests arriving meanwhile are collected into the next batch.
+    """
+
+    def __init__(self, predict_fn: Callable[[list], list], executor=None, window_ms: float = 3.0,
+                 max_rows: int = 256, max_batch_rows: int = None, max_in_flight: int = 1,
+                 delay_samples: int = 10000):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.max_batch_rows = max_batch_rows
+        # Request that didn't fit into the previous batch
+        self._pending = None
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._queue = asyncio.Queue()
+        self._task = None
+        # Metrics: batch sizes in rows and queueing delay of recent requests
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=delay_samples)
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+
+    async def predict(self, records: List[dict]) -> list:
+        """Queue records and wait for their results"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> None:
+        while True:
+            await self._in_flight.acquire()
+            if self._pending is not None:
+                requests, self._pending = [self._pending], None
+            else:
+                requests = [await self._queue.get()]
+            n_rows = len(requests[0][0])
+            deadline = time.perf_counter() + self.window
+            while n_rows < self.max_rows:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if self.max_batch_rows is not None and n_rows + len(request[0]) > self.max_batch_rows:
+                    self._pending = request
+                    break
+                requests.append(request)
+                n_rows += len(request[0])
+            asyncio.get_running_loop().create_task(self._run(requests, n_rows))
+
+    async def _run(self, requests: list, n_rows: int) -> None:
+        started = time.perf_counter()
+        self.batch_sizes[n_rows] += 1
+        self.queue_delays.extend(started - queued for _, _, queued in requests)
+        loop = asyncio.get_running_loop()
+        try:
+            records = [record for request_records, _, _ in requests for record in request_records]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_fn, records)
+            except Exception:
+                if len(requests) == 1:
+                    raise
+                # One bad request must not fail the others, score them one by one
+                for request_records, future, _ in requests:
+                    try:
+                        _set_result(future, await loop.run_in_executor(self.executor, self.predict_fn, request_records))
+                    except Exception as e:
+                        _set_exception(future, e)
+                return
+            start = 0
+            for request_records, future, _ in requests:
+                _set_result(future, results[start:start + len(request_records)])
+                start += len(request_records)
+        except Exception as e:
+            for _, future, _ in requests:
+                _set_exception(future, e)
+        finally:
+            self._in_flight.release()
+
+    def stats(self) -> dict:
+        delays_ms = sorted(delay * 1000 for delay in self.queue_delays)
+        n_batches = sum(self.batch_sizes.values())
+        return {
+            "batches": n_batches,
+            "mean_batch_rows": sum(size * count for size, count in self.batch_sizes.items()) / n_batches if n_batches else 0.0,
+            "batch_rows": dict(sorted(self.batch_sizes.items())),
+            "queue_delay_ms": {
+                "p50": delays_ms[len(delays_ms) // 2] if delays_ms else 0.0,
+                "p99": delays_ms[int(len(delays_ms) * 0.99)] if delays_ms else 0.0,
+                "max": delays_ms[-1] if delays_ms else 0.0,
+            },
+        }
@@ -0,0 +1,79 @@
+"""Serving artifact: flat NGBoost arrays as .npy files plus a JSON manifest.
+
+Layout of the artifact directory:
+    manifest.json   - format version, model scalars and encoder feature names
+    <array>.npy     - one file per FlatNGBoost array, loaded memory-mapped
+
+Loading needs only numpy, so neither ngboost, sklearn nor the pickled model
+object graph is touched at serving time.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from feature_encoder import FeatureEncoder
+from flat_trees import FlatNGBoost
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def save_artifact(path: str, model: FlatNGBoost, encoder: FeatureEncoder) -> None:
+    """Write model arrays and manifest into directory path"""
+    os.makedirs(path, exist_ok=True)
+    arrays = {}
+    # Content hash of the model, used to tell deployed artifacts apart
+    content_hash = hashlib.sha256(json.dumps(encoder.feature_names).encode())
+    for name in FlatNGBoost.ARRAYS:
+        array = np.ascontiguousarray(getattr(model, name))
+        np.save(os.path.join(path, f"{name}.npy"), array)
+        arrays[name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+        content_hash.update(array.tobytes())
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model_version": content_hash.hexdigest()[:16],
+        "learning_rate": model.learning_rate,
+        "max_depth": model.max_depth,
+        "n_features": model.n_features,
+        "n_estimators": model.n_estimators,
+        "separator": encoder.separator,
+        "feature_names": encoder.feature_names,
+        "arrays": arrays,
+    }
+    with open(os.path.join(path, MANIFEST_NAME), "w", encoding="UTF-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST_NAME), encoding="UTF-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported artifact format {manifest.get('format_version')}, expected {FORMAT_VERSION}"
+        )
+    return manifest
+
+
+def load_artifact(path: str):
+    """Load (FlatNGBoost, FeatureEncoder) with the arrays memory-mapped"""
+    manifest = read_manifest(path)
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        array = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        if array.dtype.str != spec["dtype"] or list(array.shape) != spec["shape"]:
+            raise ValueError(f"Array {name} does not match the manifest")
+        arrays[name] = array
+
+    model = FlatNGBoost(
+        learning_rate=manifest["learning_rate"],
+        max_depth=manifest["max_depth"],
+        n_features=manifest["n_features"],
+        version=manifest.get("model_version", manifest["created_at"]),
+        **arrays,
+    )
+    return model, FeatureEncoder(manifest["feature_names"], manifest["separator"])
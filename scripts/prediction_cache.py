@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class PredictionCache:
+    """LRU cache with a time to live for model predictions.
+
+    Keys are bound to a model version: as soon as a key for a different
+    version is used, every cached entry is dropped, so a newly deployed
+    artifact never serves predictions of the previous one.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model_version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_version(self, model_version: Hashable) -> None:
+        if model_version != self.model_version:
+            self._entries.clear()
+            self.model_version = model_version
+
+    def get(self, model_version: Hashable, key: Hashable) -> Optional[tuple]:
+        """Return the cached value for key, or None if it is missing or expired"""
+        self._check_version(model_version)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, model_version: Hashable, key: Hashable, value: tuple) -> None:
+        if self.max_size <= 0:
+            return
+        self._check_version(model_version)
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,129 @@
+"""Self-hosted HTTP prediction service.
+
+Serves the same model, price table, cache and confidence interval logic as
+the Lambda handler. Requests are accepted by an aiohttp event loop,
+concurrent ones are merged by a MicroBatcher and every batch is scored in a
+pool of worker processes, each of which loads the model once.
+
+Endpoints:
+    POST /get_model_prediction - one feature dict or a list of them,
+                                 ?backend=catboost scores them with CatBoost
+    GET  /health               - service status and served model version
+    GET  /metrics              - batch size and queueing delay statistics
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from aiohttp import web
+from loguru import logger
+
+import lambda_app
+from micro_batcher import MicroBatcher
+from model_artifact import read_manifest
+
+logger.add("logs/prediction_server.log", format="{time} {level} {message}", level="INFO", rotation="10 MB")
+
+HOST = os.environ.get("HOST", "127.0.0.1")
+PORT = int(os.environ.get("PORT", 8000))
+WORKERS = int(os.environ.get("WORKERS", os.cpu_count() or 1))
+KEEPALIVE_TIMEOUT = float(os.environ.get("KEEPALIVE_TIMEOUT", 75))
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 3))
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", 256))
+MODEL_PATH = "models/ngboost_serving"
+PRICE_TABLE_PATH = "models/price_table"
+PREPROCESSOR_PATH = "models/preprocessor.json"
+CATBOOST_MODEL_PATH = "models/cagboost_model.bin"
+CATBOOST_CALIBRATION_PATH = "models/catboost_calibration.json"
+
+
+def init_worker(model_path: str, price_table_path: str, preprocessor_path: str,
+                catboost_model_path: str, catboost_calibration_path: str) -> None:
+    """Point lambda_app at the local artifacts and load them once per worker"""
+    lambda_app.MODEL_PATH = model_path
+    lambda_app.PRICE_TABLE_PATH = price_table_path
+    lambda_app.PREPROCESSOR_PATH = preprocessor_path
+    lambda_app.CATBOOST_MODEL_PATH = catboost_model_path
+    lambda_app.CATBOOST_CALIBRATION_PATH = catboost_calibration_path
+    lambda_app.configure_logging()
+    model, _ = lambda_app.get_model(model_path)
+    lambda_app.get_price_table(price_table_path, model.version)
+
+
+def predict(records: list) -> list:
+    return lambda_app.handler(records, None)
+
+
+async def get_model_prediction(request: web.Request) -> web.Response:
+    try:
+        event = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+    if not isinstance(event, (dict, list)):
+        raise web.HTTPBadRequest(text="Expected a feature dict or a list of them")
+
+    records = event if isinstance(event, list) else [event]
+    if not all(isinstance(record, dict) for record in records):
+        raise web.HTTPBadRequest(text="Expected a feature dict or a list of them")
+    backend = request.query.get("backend")
+    if backend is not None:
+        # The query parameter is the default, a backend field in a record wins
+        records = [{lambda_app.BACKEND_FIELD: backend, **record} for record in records]
+    if len(records) > lambda_app.MAX_BATCH_SIZE:
+        raise web.HTTPBadRequest(text=f"Batch of {len(records)} records exceeds {lambda_app.MAX_BATCH_SIZE}")
+    try:
+        results = await request.app["batcher"].predict(records)
+    except (ValueError, TypeError) as e:
+        raise web.HTTPBadRequest(text=str(e))
+    return web.json_response(results if isinstance(event, list) else results[0])
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "ok",
+        "model_version": request.app["model_version"],
+        "workers": WORKERS,
+    })
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.json_response(request.app["batcher"].stats())
+
+
+async def start_pool(app: web.Application) -> None:
+    app["model_version"] = read_manifest(MODEL_PATH)["model_version"]
+    app["pool"] = ProcessPoolExecutor(
+        max_workers=WORKERS, initializer=init_worker, initargs=(MODEL_PATH, PRICE_TABLE_PATH, PREPROCESSOR_PATH, CATBOOST_MODEL_PATH, CATBOOST_CALIBRATION_PATH)
+    )
+    # Start the workers before accepting requests so the first one is warm
+    await asyncio.get_running_loop().run_in_executor(app["pool"], os.getpid)
+    app["batcher"] = MicroBatcher(
+        predict, app["pool"], window_ms=BATCH_WINDOW_MS, max_rows=BATCH_MAX_ROWS,
+        max_batch_rows=lambda_app.MAX_BATCH_SIZE, max_in_flight=WORKERS,
+    )
+    app["batcher"].start()
+    logger.info(f"Started {WORKERS} workers for model {app['model_version']}")
+
+
+async def stop_pool(app: web.Application) -> None:
+    await app["batcher"].stop()
+    app["pool"].shutdown()
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_post("/get_model_prediction", get_model_prediction)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    app.on_startup.append(start_pool)
+    app.on_cleanup.append(stop_pool)
+    return app
+
+
+def main():
+    logger.info(f"Serving {MODEL_PATH} on http://{HOST}:{PORT}")
+    web.run_app(create_app(), host=HOST, port=PORT, keepalive_timeout=KEEPALIVE_TIMEOUT)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,11 @@
+import argparse
+import datetime
+import functools
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
 import pandas as pd
 import numpy as np
 import logging
@@ -5,73 +13,159 @@ import logging
 logging.basicConfig(level=logging.INFO)
 
 INPUT_PATH = "data/raw/unfiltered_features.parquet"
-OUTPUT_PATH = "data/processed/clean_data.csv"
+OUTPUT_PATH = "data/processed/clean_data"
+FEATURES_CACHE_PATH = "data/interim/extracted_features.parquet"
+PREPROCESSOR_PATH = "models/preprocessor.json"
+PREPROCESSOR_FORMAT_VERSION = 2
+CHUNK_ROWS = 100_000
+
+RAW_COLUMNS = [
+    "brand_name",
+    "basePrice",
+    "Процессор_Процессор",
+    "Процессор_Количество ядер",
+    "Видеокарта_Графический контроллер",
+    "Экран_Диагональ экрана",
+    "Жесткий диск_Объем SSD",
+    "Оперативная память_Оперативная память (RAM)",
+    "Интерфейсы_Выход HDMI",
+    "Корпус_Материал корпуса",
+    "Электропитание_Работа от аккумулятора",
+]
+
+
+def get_frequent_categories(counts: pd.Series, percent: float = 0.05) -> pd.Index:
+    """Categories with a share of counts of at least percent, the ones kept as is"""
+    shares = counts / counts.sum()
+    return shares[shares >= percent].index
+
+
+def keep_frequent_categories(column: pd.Series, frequent_categories: pd.Index,
+                             replace_with: str = "other") -> pd.Series:
+    """Replace every category but the frequent ones, including ones never seen before, by replace_with"""
+    return column.where(column.isin(frequent_categories) | column.isna(), replace_with)
+
+
+def fill_by_group(values: pd.Series, groups: pd.Series, group_values: pd.Series, default: float) -> pd.Series:
+    """Fill missing values with the value of their group, or default for groups the fit didn't see"""
+    fill = groups.map(group_values).where(groups.isin(group_values.index), default)
+    return values.astype(float).fillna(fill)
+
+
+# Raw columns repeat a few hundred distinct strings across all rows, so every
+# parser below runs on distinct values only and the result is broadcast back.
+# One regex per field. Where several keywords can match, the alternatives
+# are lookaheads ordered by priority, so the first matching group wins.
+PROC_FREQ_PATTERN = r"(?:^|\s)(\S+)\s+ГГц\s*$"
+PROC_TOKENS_PATTERN = r"^\s*(\S+)(?:\s+(\S+))?(?:\s+(\S+))?"
+VIDEOCARD_PATTERN = (
+    r"(?s)^(?:(?=.*(Intel|UHD Graphics))|(?=.*(Radeon))|(?=.*(GeForce MX))|(?=.*(GeForce GTX))|(?=.*(GeForce RTX)))"
+)
+VIDEOCARD_LABELS = ["интегрированная", "Radeon", "GeForce MX", "GeForce GTX", "GeForce RTX"]
+VIDEO_MEMORY_PATTERN = r"(?:^|\s)(\d+)GB\s*$"
+VOLUME_PATTERN = r"^\s*(\d+)\s+(\S+)\s*$"
+MATERIAL_PATTERN = r"(?s)^(?:(?=.*(алюмин|металл|сплав|магний))|(?=.*(пластик|углерод|поликарб)))"
+MATERIAL_LABELS = ["металл", "пластик"]
+BATTERY_PATTERN = r"^\s*\S+\s+(\S+)"
+# Bump when the parsers below give other features for the same raw fields
+# for a reason the patterns don't show, it discards the features cache
+EXTRACTION_LOGIC_VERSION = 1
+
+
+def on_unique_values(parse):
+    """Run a column parser on the distinct values and map the result to all rows"""
+    @functools.wraps(parse)
+    def wrapper(column: pd.Series):
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        parsed = parse(pd.Series(uniques, dtype=object))
+        if isinstance(parsed, tuple):
+            return tuple(pd.Series(part.to_numpy()[codes], index=column.index) for part in parsed)
+        return pd.Series(parsed.to_numpy()[codes], index=column.index)
+    return wrapper
+
+
+def first_matched_label(groups: pd.DataFrame, labels: list) -> pd.Series:
+    """Label of the first group that matched in every row, NaN if none did"""
+    result = pd.Series(np.nan, index=groups.index, dtype=object)
+    for column, label in reversed(list(zip(groups.columns, labels))):
+        result = result.mask(groups[column].notna(), label)
+    return result
 
 
-def replace_rare_category(column: pd.Series, percent: float = 0.05, replace_with: str = "other") -> pd.Series:
-    counts = column.value_counts(normalize=True)
-    rare_categories = counts[counts < percent].index
-    return column.replace(dict.fromkeys(rare_categories, replace_with))
+@on_unique_values
+def proc_frequency(proc: pd.Series) -> pd.Series:
+    """Frequency in GHz, the number before a trailing "ГГц" token"""
+    return proc.str.extract(PROC_FREQ_PATTERN)[0].astype(float)
 
 
-def proc_frequency(proc: str) -> float:
-    values = proc.split()
-    if values and values[-1] == "ГГц":
-        return float(values[-2])
-    else:
-        return np.NAN
+@on_unique_values
+def get_proc_words(proc: pd.Series):
+    """First word of the processor and its name: two words, three for Intel Core"""
+    tokens = proc.str.extract(PROC_TOKENS_PATTERN)
+    first_two = tokens[0].str.cat(tokens[1], sep=" ", na_rep="").str.rstrip()
+    first_three = first_two.str.cat(tokens[2], sep=" ", na_rep="").str.rstrip()
+    is_intel_core = (tokens[0] == "Intel") & (tokens[1] == "Core")
+    return tokens[0], first_three.where(is_intel_core, first_two).where(tokens[0].notna())
 
 
-def get_video_memory(column):
-    if not column or column == "интегрированная":
-        return 0
-    values = column.split()
-    if values and values[-1].endswith("GB"):
-        return int(values[-1].replace("GB", ""))
-    else:
-        return np.NAN
+def get_popular_names(counts: pd.Series, popular_share: float = 0.05) -> pd.Index:
+    """Processor names that make up more than popular_share of the rows"""
+    shares = counts / counts.sum()
+    return shares[shares > popular_share].index
 
 
-def get_proc_name(proc: str, popular_names: list = None):
-    values = proc.split()
-    if not values:
-        return np.NAN
-    if values[0] == "Intel" and values[1] == "Core":
-        result = " ".join(values[0:3])
-    else:
-        result = " ".join(values[0:2])
+def get_proc_name(first_word: pd.Series, names: pd.Series, popular_names: pd.Index) -> pd.Series:
+    """Processor name, names that are not popular are replaced by the first word only"""
+    return names.where(names.isin(popular_names), first_word).str.lower()
 
-    if not popular_names is None:
-        if result not in popular_names:
-            result = values[0]
-    return result
 
+@on_unique_values
+def get_videocard(videocard: pd.Series):
+    """Videocard family and its memory in GB.
 
-def convert_volume_to_number(val):
-    if not val:
-        return 0
-    num, item = val.split()
-    num = int(num)
-    if item.lower() == "тб":
-        return 1024 * num
-    else:
-        return num
+    Intel and UHD Graphics cards are integrated and have no memory of their
+    own, otherwise the memory is taken from a trailing "<N>GB" token.
+    """
+    videocard = videocard.fillna("интегрированная")
+    family = first_matched_label(videocard.str.extract(VIDEOCARD_PATTERN), VIDEOCARD_LABELS)
+    is_integrated = (family == "интегрированная") | (videocard == "интегрированная") | (videocard == "")
+    memory = videocard.str.extract(VIDEO_MEMORY_PATTERN)[0].astype(float).mask(is_integrated, 0)
+    return family.fillna(videocard), memory
 
 
-def fill_na(df: pd.DataFrame) -> pd.DataFrame:
-    df_new = df.copy()
-    df_new["proc_freq"] = df_new.groupby("proc_brand").proc_freq.transform(lambda x: x.fillna(x.mean()))
-    df_new["proc_count"] = df_new.groupby("proc_brand").proc_count.transform(lambda x: x.fillna(x.mean()))
-    df_new["videocard_memory"] = df_new.groupby("videocard").videocard_memory.transform(
-        lambda x: x.fillna(np.NaN if not x.count() else x.mode()[0]))
-    df_new["videocard_memory"] = df_new["videocard_memory"].fillna(0)
-    df_new["screen"] = df_new["screen"].fillna(df_new["screen"].mode()[0])
-    df_new["material"] = df_new["material"].fillna(df_new["material"].mode()[0])
-    df_new["battery_life"] = df_new.groupby("brand_name").battery_life.transform(lambda x: x.fillna(x.mean()))
-    return df_new
+@on_unique_values
+def convert_volume_to_number(volume: pd.Series) -> pd.Series:
+    """Volume in GB from strings like "512 ГБ" or "1 ТБ", 0 if missing"""
+    parts = volume.str.extract(VOLUME_PATTERN)
+    multiplier = np.where(parts[1].str.lower() == "тб", 1024, 1)
+    return (parts[0].astype(float) * multiplier).fillna(0).astype(int)
+
+
+@on_unique_values
+def get_material(material: pd.Series) -> pd.Series:
+    groups = material.str.extract(MATERIAL_PATTERN)
+    labels = first_matched_label(groups, MATERIAL_LABELS)
+    return labels.where(labels.notna(), material)
 
 
-def prepare_data(df: pd.DataFrame) -> pd.DataFrame:
+@on_unique_values
+def get_screen(screen: pd.Series) -> pd.Series:
+    """Screen diagonal in whole inches from strings like '15.6"(39.6 см)'"""
+    return np.trunc(screen.replace("", np.nan).str.extract(r'^([^"]*)')[0].astype(float))
+
+
+@on_unique_values
+def get_battery_life(battery: pd.Series) -> pd.Series:
+    """Battery life in hours from strings like "до 7 часов" """
+    return battery.replace("", np.nan).str.extract(BATTERY_PATTERN)[0].astype(float)
+
+
+def extract_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Features of every row that don't depend on the other rows.
+
+    brand_name and videocard are not yet grouped into "other" and
+    lowercased, proc_name is the full name and proc_word its first word.
+    """
     selected_features = [
         "brand_name"
     ]
@@ -79,64 +173,358 @@ def prepare_data(df: pd.DataFrame) -> pd.DataFrame:
     df_new = df[selected_features].copy()
     df_new["priceLog"] = np.log1p(df.basePrice)
 
-    df_new["brand_name"] = replace_rare_category(df_new["brand_name"])
-    df_new["brand_name"] = df_new["brand_name"].str.lower()
+    proc = df["Процессор_Процессор"]
+    df_new["proc_freq"] = proc_frequency(proc)
+    df_new["proc_word"], df_new["proc_name"] = get_proc_words(proc)
+    df_new.insert(df_new.columns.get_loc("proc_word"), "proc_brand", df_new["proc_word"].str.lower())
 
-    df_new["proc_freq"] = df["Процессор_Процессор"].apply(proc_frequency)
-    df_new["proc_brand"] = df["Процессор_Процессор"].apply(lambda x: x.split()[0])
-    df_new["proc_brand"] = df_new["proc_brand"].str.lower()
+    df_new["proc_count"] = df["Процессор_Количество ядер"]
 
-    proc_names_counts = df["Процессор_Процессор"].apply(get_proc_name).value_counts(normalize=True)
-    popular_proc_names = proc_names_counts[proc_names_counts > 0.05].index
-    df_new["proc_name"] = df["Процессор_Процессор"].apply(get_proc_name, args=(popular_proc_names,))
-    df_new["proc_name"] = df_new["proc_name"].str.lower()
+    df_new["videocard"], df_new["videocard_memory"] = get_videocard(df["Видеокарта_Графический контроллер"])
 
-    df_new["proc_count"] = df["Процессор_Количество ядер"]
+    df_new["screen"] = get_screen(df["Экран_Диагональ экрана"])
+
+    df_new["ssd_volume"] = convert_volume_to_number(df["Жесткий диск_Объем SSD"])
+    df_new["ram"] = df["Оперативная память_Оперативная память (RAM)"]
+    df_new["hdmi"] = ~df["Интерфейсы_Выход HDMI"].isna()
+
+    df_new["material"] = get_material(df["Корпус_Материал корпуса"])
 
-    df_new["videocard"] = df["Видеокарта_Графический контроллер"]
-    df_new.loc[df_new["videocard"].isna(), "videocard"] = "интегрированная"
-    df_new.loc[df_new["videocard"].str.contains("Intel"), "videocard"] = "интегрированная"
-    df_new.loc[df_new["videocard"].str.contains("UHD Graphics"), "videocard"] = "интегрированная"
+    df_new["battery_life"] = get_battery_life(df["Электропитание_Работа от аккумулятора"])
 
-    df_new["videocard_memory"] = df_new["videocard"].apply(get_video_memory)
+    return df_new
 
-    df_new.loc[df_new["videocard"].str.contains("GeForce RTX"), "videocard"] = "GeForce RTX"
-    df_new.loc[df_new["videocard"].str.contains("GeForce GTX"), "videocard"] = "GeForce GTX"
-    df_new.loc[df_new["videocard"].str.contains("GeForce MX"), "videocard"] = "GeForce MX"
-    df_new.loc[df_new["videocard"].str.contains("Radeon"), "videocard"] = "Radeon"
-    df_new["videocard"] = replace_rare_category(df_new["videocard"], percent=0.03)
+
+def iter_raw_chunks(path: str, chunk_rows: int = CHUNK_ROWS):
+    """Raw parquet rows in DataFrames of at most chunk_rows rows, indexed by product ID"""
+    # Imported here so that serving, which only transforms records, doesn't need pyarrow
+    import pyarrow.parquet as pq
+
+    raw_file = pq.ParquetFile(path)
+    pandas_metadata = raw_file.schema_arrow.pandas_metadata or {}
+    # A RangeIndex is stored as a description, not as a column
+    index_columns = [name for name in pandas_metadata.get("index_columns", []) if isinstance(name, str)]
+    for batch in raw_file.iter_batches(batch_size=chunk_rows, columns=RAW_COLUMNS + index_columns):
+        yield batch.to_pandas()
+
+
+def chunk_statistics(features: pd.DataFrame) -> dict:
+    """Counts and sums over one chunk of extract_features output.
+
+    Keys are the raw categories, so statistics of several chunks are merged
+    by adding them up with merge_statistics.
+    """
+    return {
+        "brand_counts": features["brand_name"].value_counts(),
+        "proc_name_counts": features["proc_name"].value_counts(),
+        "videocard_counts": features["videocard"].value_counts(),
+        "proc_freq_sums": features.groupby("proc_brand").proc_freq.agg(["sum", "count"]),
+        "proc_count_sums": features.groupby("proc_brand").proc_count.agg(["sum", "count"]),
+        "videocard_memory_counts": features.groupby(["videocard", "videocard_memory"]).size(),
+        "screen_counts": features["screen"].value_counts(),
+        "material_counts": features["material"].value_counts(),
+        "battery_life_sums": features.groupby(features["brand_name"]).battery_life.agg(["sum", "count"]),
+    }
+
+
+def merge_statistics(left: dict, right: dict) -> dict:
+    return {name: left[name].add(right[name], fill_value=0) for name in left}
+
+
+def get_mode(counts: pd.Series) -> pd.Series:
+    """Most frequent value per group from counts indexed by (group, value),
+    ties go to the smallest value like in Series.mode"""
+    group, value = counts.index.names
+    frame = counts.rename("n").reset_index().sort_values(["n", value], ascending=[False, True])
+    return frame.drop_duplicates(group).set_index(group)[value]
+
+
+def finalize_statistics(stats: dict) -> dict:
+    """Frequent categories, popular names and fill values from merged statistics"""
+    frequent_brands = get_frequent_categories(stats["brand_counts"])
+    frequent_videocards = get_frequent_categories(stats["videocard_counts"], percent=0.03)
+
+    def final_brand(raw: pd.Index) -> pd.Index:
+        return pd.Index(keep_frequent_categories(pd.Series(raw), frequent_brands).str.lower())
+
+    def final_videocard(raw: pd.Index) -> pd.Index:
+        return pd.Index(keep_frequent_categories(pd.Series(raw), frequent_videocards).str.lower())
+
+    battery = stats["battery_life_sums"].groupby(final_brand(stats["battery_life_sums"].index)).sum()
+    memory_counts = stats["videocard_memory_counts"]
+    memory_counts = memory_counts.groupby([
+        final_videocard(memory_counts.index.get_level_values(0)).rename("videocard"),
+        memory_counts.index.get_level_values(1),
+    ]).sum()
+    return {
+        "frequent_brands": frequent_brands,
+        "frequent_videocards": frequent_videocards,
+        "popular_proc_names": get_popular_names(stats["proc_name_counts"]),
+        "proc_freq_means": stats["proc_freq_sums"]["sum"] / stats["proc_freq_sums"]["count"],
+        "proc_freq_mean": stats["proc_freq_sums"]["sum"].sum() / stats["proc_freq_sums"]["count"].sum(),
+        "proc_count_means": stats["proc_count_sums"]["sum"] / stats["proc_count_sums"]["count"],
+        "proc_count_mean": stats["proc_count_sums"]["sum"].sum() / stats["proc_count_sums"]["count"].sum(),
+        "videocard_memory_modes": get_mode(memory_counts),
+        "screen_mode": stats["screen_counts"].sort_index().idxmax(),
+        "material_mode": stats["material_counts"].sort_index().idxmax(),
+        "battery_life_means": battery["sum"] / battery["count"],
+        "battery_life_mean": battery["sum"].sum() / battery["count"].sum(),
+    }
+
+
+def transform_features(features: pd.DataFrame, stats: dict) -> pd.DataFrame:
+    """Group rare categories and fill missing values of extract_features output,
+    with the statistics of the whole dataset given by finalize_statistics.
+
+    Categories and groups the statistics don't know, e.g. a brand that
+    appeared after the fit, are handled like rare ones: the category becomes
+    "other" and missing values are filled with the mean of all rows.
+    """
+    df_new = features
+    df_new["brand_name"] = keep_frequent_categories(df_new["brand_name"], stats["frequent_brands"])
+    df_new["brand_name"] = df_new["brand_name"].str.lower()
+    df_new["proc_name"] = get_proc_name(df_new.pop("proc_word"), df_new["proc_name"], stats["popular_proc_names"])
+    df_new["videocard"] = keep_frequent_categories(df_new["videocard"], stats["frequent_videocards"])
     df_new["videocard"] = df_new["videocard"].str.lower()
 
-    df_new["screen"] = df["Экран_Диагональ экрана"].apply(lambda x: np.NAN if not x else int(float(x.split('"')[0])))
+    df_new["proc_freq"] = fill_by_group(
+        df_new["proc_freq"], df_new["proc_brand"], stats["proc_freq_means"], stats["proc_freq_mean"])
+    df_new["proc_count"] = fill_by_group(
+        df_new["proc_count"], df_new["proc_brand"], stats["proc_count_means"], stats["proc_count_mean"])
+    df_new["videocard_memory"] = df_new["videocard_memory"].fillna(
+        df_new["videocard"].map(stats["videocard_memory_modes"]))
+    df_new["videocard_memory"] = df_new["videocard_memory"].fillna(0)
+    df_new["screen"] = df_new["screen"].fillna(stats["screen_mode"])
+    df_new["material"] = df_new["material"].fillna(stats["material_mode"])
+    df_new["battery_life"] = fill_by_group(
+        df_new["battery_life"], df_new["brand_name"], stats["battery_life_means"], stats["battery_life_mean"])
+    return df_new
 
-    df_new["ssd_volume"] = df["Жесткий диск_Объем SSD"].apply(convert_volume_to_number)
-    df_new["ram"] = df["Оперативная память_Оперативная память (RAM)"]
-    df_new["hdmi"] = ~df["Интерфейсы_Выход HDMI"].isna()
 
-    df_new["material"] = df["Корпус_Материал корпуса"]
-    df_new.loc[~df_new["material"].isna() & df_new["material"].str.contains("алюмин|металл|сплав|магний"), "material"] = "металл"
-    df_new.loc[~df_new["material"].isna() & df_new["material"].str.contains("пластик|углерод|поликарб"), "material"] = "пластик"
+class Preprocessor:
+    """Cleaning of raw shop records with statistics fitted once.
+
+    Keeps what the cleaning learns from the whole dataset (frequent brands
+    and videocards, popular processor names, group means and modes), so new
+    raw records are transformed row by row without refitting, the same way
+    in training and in serving.
+    """
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    @classmethod
+    def fit(cls, df: pd.DataFrame) -> "Preprocessor":
+        return cls.fit_chunks([df])
+
+    @classmethod
+    def fit_chunks(cls, chunks: Iterable[pd.DataFrame]) -> "Preprocessor":
+        """Fit on raw data given in parts, e.g. iter_raw_chunks"""
+        return cls.fit_features(extract_features(chunk) for chunk in chunks)
+
+    @classmethod
+    def fit_features(cls, chunks: Iterable[pd.DataFrame]) -> "Preprocessor":
+        """Fit on parts of extract_features output"""
+        stats = None
+        for features in chunks:
+            chunk_stats = chunk_statistics(features)
+            stats = chunk_stats if stats is None else merge_statistics(stats, chunk_stats)
+        return cls(finalize_statistics(stats))
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return transform_features(extract_features(df), self.stats)
+
+    def transform_features(self, features: pd.DataFrame) -> pd.DataFrame:
+        """Transform extract_features output, which is left unchanged"""
+        return transform_features(features.copy(), self.stats)
+
+    def transform_records(self, records: List[dict]) -> List[dict]:
+        """Model features for raw shop records, missing raw fields count as empty"""
+        df = pd.DataFrame.from_records(records, columns=RAW_COLUMNS)
+        return self.transform(df).drop(columns="priceLog").to_dict(orient="records")
+
+    def save(self, path: str) -> None:
+        stats = {
+            name: value.tolist() if isinstance(value, pd.Index)
+            else value.astype(float).to_dict() if isinstance(value, pd.Series)
+            else value.item() if isinstance(value, np.generic)
+            else value
+            for name, value in self.stats.items()
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="UTF-8") as f:
+            json.dump({"format_version": PREPROCESSOR_FORMAT_VERSION, "statistics": stats}, f,
+                      ensure_ascii=False, indent=4)
+
+    @classmethod
+    def load(cls, path: str) -> "Preprocessor":
+        with open(path, encoding="UTF-8") as f:
+            saved = json.load(f)
+        if saved.get("format_version") != PREPROCESSOR_FORMAT_VERSION:
+            raise ValueError(
+                f"Preprocessor {path} has format version {saved.get('format_version')}, "
+                f"expected {PREPROCESSOR_FORMAT_VERSION}"
+            )
+        stats = {
+            name: pd.Index(value, dtype=object) if isinstance(value, list)
+            else pd.Series(value, dtype=float) if isinstance(value, dict)
+            else value
+            for name, value in saved["statistics"].items()
+        }
+        return cls(stats)
+
+
+def extract_part(df: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
+    features = extract_features(df)
+    return features, chunk_statistics(features)
+
+
+def extract_features_parallel(df: pd.DataFrame, workers: int = 1) -> Tuple[pd.DataFrame, dict]:
+    """extract_features and chunk_statistics of df using a pool of workers processes.
+
+    df is split into one part per worker, every worker parses its part and
+    counts its partial statistics, which are then merged into the statistics
+    of the whole frame.
+    """
+    if workers <= 1 or len(df) < workers:
+        return extract_part(df)
+    parts = [df.iloc[rows] for rows in np.array_split(np.arange(len(df)), workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(extract_part, parts))
+    features = pd.concat([part_features for part_features, _ in results])
+    stats = functools.reduce(merge_statistics, [part_stats for _, part_stats in results])
+    return features, stats
+
+
+def content_hash(df: pd.DataFrame) -> pd.Series:
+    """Hash of the raw fields of every product, it changes when any of them does"""
+    return pd.util.hash_pandas_object(df[RAW_COLUMNS], index=False)
+
+
+def extraction_version() -> str:
+    """Version of extract_features, it changes with the patterns and EXTRACTION_LOGIC_VERSION"""
+    logic = [
+        EXTRACTION_LOGIC_VERSION, RAW_COLUMNS,
+        PROC_FREQ_PATTERN, PROC_TOKENS_PATTERN, VIDEOCARD_PATTERN, VIDEOCARD_LABELS,
+        VIDEO_MEMORY_PATTERN, VOLUME_PATTERN, MATERIAL_PATTERN, MATERIAL_LABELS, BATTERY_PATTERN,
+    ]
+    return hashlib.sha256(json.dumps(logic, ensure_ascii=False).encode()).hexdigest()[:16]
+
+
+def read_features_cache(cache_path: str, version: str) -> Optional[pd.DataFrame]:
+    """Cached features, None if there is no cache or it was extracted by another version"""
+    if not os.path.exists(cache_path):
+        logging.info(f"No features cache at {cache_path}")
+        return None
+    cached = pd.read_parquet(cache_path)
+    if "extraction_version" not in cached or not (cached["extraction_version"] == version).all():
+        logging.info(f"Features cache at {cache_path} was extracted by another version, discarding it")
+        return None
+    return cached
+
+
+def extract_features_incremental(df: pd.DataFrame, cache_path: str, workers: int = 1) -> pd.DataFrame:
+    """extract_features for raw data indexed by product ID, reusing the cache.
+
+    The cache keeps the extracted features and content hash of every product
+    of the previous run. Only new and changed products are parsed again,
+    products missing from df are dropped, and the cache is updated. The cache
+    is also tagged with extraction_version, and a cache made by other
+    patterns or parsing logic is discarded as a whole.
+    """
+    version = extraction_version()
+    hashes = content_hash(df)
+    unchanged = np.zeros(len(df), dtype=bool)
+    cached = read_features_cache(cache_path, version)
+    if cached is not None:
+        known = df.index.isin(cached.index)
+        unchanged[known] = cached.loc[df.index[known], "content_hash"].to_numpy() == hashes[known].to_numpy()
+        logging.info(
+            f"Products: {(~known).sum()} new, {known.sum() - unchanged.sum()} changed, {unchanged.sum()} unchanged, "
+            f"{(~cached.index.isin(df.index)).sum()} removed"
+        )
+        parts = [cached.loc[df.index[unchanged]]]
+    else:
+        logging.info(f"Extracting all {len(df)} products")
+        parts = []
+
+    if not unchanged.all():
+        changed = df[~unchanged]
+        features, _ = extract_features_parallel(changed, workers)
+        features["content_hash"] = hashes[~unchanged]
+        features["extraction_version"] = version
+        parts.append(features)
 
-    df_new["battery_life"] = df["Электропитание_Работа от аккумулятора"].apply(lambda x: np.NaN if not x else float(x.split()[1]))
+    features = pd.concat(parts).loc[df.index]
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    features.to_parquet(cache_path)
+    return features.drop(columns=["content_hash", "extraction_version"])
 
-    return df_new
 
+def check_scrape_date(scrape_date: str) -> str:
+    """Validate a scrape date given on the command line, it names the dataset partition"""
+    return datetime.date.fromisoformat(scrape_date).isoformat()
 
 
-def main():
-    logging.info("Start")
+def prepare_data_streaming(input_path: str, output_path: str, scrape_date: str,
+                           chunk_rows: int = CHUNK_ROWS) -> Preprocessor:
+    """Clean the raw parquet chunk by chunk in two passes.
 
-    logging.info(f"Reading data from {INPUT_PATH}")
-    df = pd.read_parquet(INPUT_PATH)
+    The first pass only keeps the per-category counts and sums needed for
+    the frequent categories and fill values, the second one transforms every
+    chunk with them and appends it to the scrape_date partition of the
+    output dataset, so memory stays bounded by the chunk size.
+    """
+    from processed_dataset import DatasetWriter
 
-    logging.info("Cleaning data ...")
-    df_new = prepare_data(df)
-    df_new = fill_na(df_new)
+    preprocessor = Preprocessor.fit_chunks(iter_raw_chunks(input_path, chunk_rows))
 
-    logging.info("Saving data ...")
-    df_new.to_csv(OUTPUT_PATH, index=False)
+    with DatasetWriter(output_path, scrape_date) as writer:
+        for chunk_num, chunk in enumerate(iter_raw_chunks(input_path, chunk_rows)):
+            writer.write(preprocessor.transform(chunk))
+            logging.info(f"Chunk {chunk_num}: {writer.n_rows} rows saved")
+    return preprocessor
 
-    logging.info(f"Data saved to {OUTPUT_PATH}")
+
+def main():
+    # pyarrow is only needed here, serving imports this module for Preprocessor
+    from processed_dataset import write_dataset
+
+    parser = argparse.ArgumentParser(description="Clean raw notebook features")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--streaming", action="store_true", help="clean the raw parquet chunk by chunk")
+    mode.add_argument("--incremental", action="store_true",
+                      help=f"parse only new and changed products, reusing {FEATURES_CACHE_PATH}")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1, help="processes parsing the raw data in parallel")
+    parser.add_argument("--scrape-date", required=True,
+                        help="date of the scrape in the raw dump (YYYY-MM-DD), the partition to write")
+    args = parser.parse_args()
+    scrape_date = check_scrape_date(args.scrape_date)
+
+    logging.info("Start")
+    if args.streaming:
+        logging.info(f"Cleaning {INPUT_PATH} in chunks of {args.chunk_rows} rows ...")
+        preprocessor = prepare_data_streaming(INPUT_PATH, OUTPUT_PATH, scrape_date, args.chunk_rows)
+    else:
+        logging.info(f"Reading data from {INPUT_PATH}")
+        df = pd.read_parquet(INPUT_PATH, columns=RAW_COLUMNS)
+
+        logging.info("Cleaning data ...")
+        if args.incremental:
+            features = extract_features_incremental(df, FEATURES_CACHE_PATH, args.workers)
+            preprocessor = Preprocessor.fit_features([features])
+        else:
+            features, stats = extract_features_parallel(df, args.workers)
+            preprocessor = Preprocessor(finalize_statistics(stats))
+        df_new = transform_features(features, preprocessor.stats)
+
+        logging.info("Saving data ...")
+        write_dataset(df_new, OUTPUT_PATH, scrape_date)
+    logging.info(f"Data saved to {OUTPUT_PATH}, scrape date {scrape_date}")
+
+    preprocessor.save(PREPROCESSOR_PATH)
+    logging.info(f"Preprocessor saved to {PREPROCESSOR_PATH}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+"""Precomputed price ranges for a grid of feature values.
+
+The grid is a list of axes. Each axis covers one or more fields and lists
+the allowed value combinations for them, e.g. the (proc_brand, proc_name)
+pairs offered by the bot. A record on the grid picks exactly one
+combination per axis, so its position in the table is a mixed-radix number
+and a lookup is a handful of dict lookups plus one array read.
+
+Layout of the table directory:
+    grid.json       - model version, confidence level and grid axes
+    prices.npy      - structured array with min_price and max_price per cell
+"""
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+GRID_NAME = "grid.json"
+PRICES_NAME = "prices.npy"
+PRICE_DTYPE = np.dtype([("min_price", np.float32), ("max_price", np.float32)])
+# Level of the price ranges in tables saved before it was recorded
+DEFAULT_LEVEL = 0.95
+
+
+class PriceTable:
+    def __init__(self, axes: List[dict], prices: np.array, model_version: str = None, level: float = DEFAULT_LEVEL):
+        self.axes = axes
+        self.prices = prices
+        self.model_version = model_version
+        self.level = level
+        self.fields = frozenset(field for axis in axes for field in axis["fields"])
+        self.shape = tuple(len(axis["values"]) for axis in axes)
+        # value combination -> position, resolved once per axis
+        self._positions = [
+            {tuple(values): pos for pos, values in enumerate(axis["values"])}
+            for axis in axes
+        ]
+        if len(prices) != int(np.prod(self.shape)):
+            raise ValueError(f"Price table has {len(prices)} cells, grid needs {int(np.prod(self.shape))}")
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def lookup(self, record: dict) -> Optional[dict]:
+        """Price range for record, or None if the record is not on the grid"""
+        if record.keys() != self.fields:
+            return None
+        idx = 0
+        for axis, positions, size in zip(self.axes, self._positions, self.shape):
+            pos = positions.get(tuple(record[field] for field in axis["fields"]))
+            if pos is None:
+                return None
+            idx = idx * size + pos
+        min_price, max_price = self.prices[idx]
+        return {"min_price": float(min_price), "max_price": float(max_price)}
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, PRICES_NAME), self.prices)
+        with open(os.path.join(path, GRID_NAME), "w", encoding="UTF-8") as f:
+            json.dump({"model_version": self.model_version, "level": self.level, "axes": self.axes},
+                      f, ensure_ascii=False, indent=4)
+
+    @classmethod
+    def load(cls, path: str) -> "PriceTable":
+        with open(os.path.join(path, GRID_NAME), encoding="UTF-8") as f:
+            grid = json.load(f)
+        prices = np.load(os.path.join(path, PRICES_NAME), mmap_mode="r")
+        return cls(grid["axes"], prices, grid["model_version"], grid.get("level", DEFAULT_LEVEL))
@@ -0,0 +1,113 @@
+"""Typed Parquet storage of the cleaned training data.
+
+The dataset is a directory partitioned by scrape date, one Parquet file
+per partition:
+    <path>/scrape_date=2024-05-01/part-0.parquet
+
+Every file carries SCHEMA: string features are dictionary encoded, so they
+come back as pandas categoricals, and the schema metadata holds
+SCHEMA_VERSION, which read_dataset checks before loading anything. The
+product ID comes from the index of the cleaned DataFrame.
+"""
+import os
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SCHEMA_VERSION = 2
+PARTITION_COLUMN = "scrape_date"
+PART_NAME = "part-0.parquet"
+PRODUCT_ID = "product_id"
+
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema(
+    [
+        (PRODUCT_ID, pa.int64()),
+        ("brand_name", CATEGORY),
+        ("priceLog", pa.float64()),
+        ("proc_freq", pa.float64()),
+        ("proc_brand", CATEGORY),
+        ("proc_name", CATEGORY),
+        ("proc_count", pa.float64()),
+        ("videocard", CATEGORY),
+        ("videocard_memory", pa.float64()),
+        ("screen", pa.float64()),
+        ("ssd_volume", pa.int64()),
+        ("ram", pa.float64()),
+        ("hdmi", pa.bool_()),
+        ("material", CATEGORY),
+        ("battery_life", pa.float64()),
+    ],
+    metadata={"schema_version": str(SCHEMA_VERSION)},
+)
+
+
+def partition_path(path: str, scrape_date: str) -> str:
+    return os.path.join(path, f"{PARTITION_COLUMN}={scrape_date}")
+
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """Cast cleaned data to SCHEMA, raises if a column is missing or can't be cast"""
+    df = df.rename_axis(PRODUCT_ID).reset_index()
+    return pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+
+class DatasetWriter:
+    """Writes one scrape date partition chunk by chunk, replacing the old one"""
+
+    def __init__(self, path: str, scrape_date: str):
+        directory = partition_path(path, scrape_date)
+        os.makedirs(directory, exist_ok=True)
+        self.file_path = os.path.join(directory, PART_NAME)
+        self._writer = pq.ParquetWriter(self.file_path, SCHEMA)
+        self.n_rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._writer.write_table(to_table(df))
+        self.n_rows += len(df)
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_dataset(df: pd.DataFrame, path: str, scrape_date: str) -> str:
+    """Save df as the scrape_date partition of the dataset at path"""
+    with DatasetWriter(path, scrape_date) as writer:
+        writer.write(df)
+    return writer.file_path
+
+
+def check_schema(schema: pa.Schema, path: str) -> None:
+    metadata = schema.metadata or {}
+    version = metadata.get(b"schema_version", b"").decode()
+    if version != str(SCHEMA_VERSION):
+        raise ValueError(f"Dataset {path} has schema version {version or None}, expected {SCHEMA_VERSION}")
+    missing = set(SCHEMA.names) - set(schema.names)
+    if missing:
+        raise ValueError(f"Dataset {path} lacks columns {sorted(missing)}")
+
+
+def list_scrape_dates(path: str) -> List[str]:
+    prefix = f"{PARTITION_COLUMN}="
+    return sorted(name[len(prefix):] for name in os.listdir(path) if name.startswith(prefix))
+
+
+def read_dataset(path: str, columns: Optional[List[str]] = None,
+                 scrape_dates: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read the dataset at path, all scrape dates or only the given ones"""
+    dataset = ds.dataset(
+        path, format="parquet", partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+    )
+    for fragment in dataset.get_fragments():
+        check_schema(fragment.physical_schema, fragment.path)
+    row_filter = ds.field(PARTITION_COLUMN).isin(scrape_dates) if scrape_dates is not None else None
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
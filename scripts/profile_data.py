@@ -0,0 +1,309 @@
+"""Data-quality and drift profile of a raw scrape.
+
+The raw dump is read chunk by chunk and every chunk goes through
+prepare_data.extract_features, so the profile sees the parsed features
+before rare categories are grouped and missing values are filled: null
+rates show parse failures and category frequencies show new values. Per
+column it keeps the row and null counts, category frequencies for string
+and bool columns and a quantile sketch for numbers. All of them are merged
+chunk by chunk, so the profile is built in one pass with bounded memory.
+
+The profile is saved per scrape date and compared with the latest earlier
+one. If no column drifted, retraining can be skipped.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from prepare_data import CHUNK_ROWS, INPUT_PATH, check_scrape_date, extract_features, iter_raw_chunks
+
+logging.basicConfig(level=logging.INFO)
+
+PROFILES_PATH = "data/profiles"
+PROFILED_COLUMNS = [
+    "brand_name",
+    "priceLog",
+    "proc_freq",
+    "proc_brand",
+    "proc_name",
+    "proc_count",
+    "videocard",
+    "videocard_memory",
+    "screen",
+    "ssd_volume",
+    "ram",
+    "hdmi",
+    "material",
+    "battery_life",
+]
+RELATIVE_ACCURACY = 0.01
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Drift thresholds
+ROW_COUNT_CHANGE = 0.2  # relative change of the number of rows
+NULL_RATE_CHANGE = 0.02  # absolute change of the share of missing values
+CATEGORY_PSI = 0.1  # population stability index of category frequencies
+NEW_CATEGORY_SHARE = 0.01  # share of rows with a category unseen before
+QUANTILE_CHANGE = 0.05  # relative change of any of QUANTILES
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with a bounded relative error.
+
+    Values are counted in logarithmically spaced buckets, so any quantile is
+    returned within relative_accuracy of a value of that rank, whatever the
+    scale of the data, and two sketches are merged by adding the counts.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = Counter()
+        self.negative = Counter()
+        self.zeros = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.positive.values()) + sum(self.negative.values()) + self.zeros
+
+    def _add(self, store: Counter, values: np.array) -> None:
+        keys, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(int), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] += count
+
+    def update(self, values: np.array) -> None:
+        values = values[~np.isnan(values)]
+        self._add(self.positive, values[values > 0])
+        self._add(self.negative, -values[values < 0])
+        self.zeros += int((values == 0).sum())
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+        self.zeros += other.zeros
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positive": {str(key): count for key, count in sorted(self.positive.items())},
+            "negative": {str(key): count for key, count in sorted(self.negative.items())},
+            "zeros": self.zeros,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.positive.update({int(key): count for key, count in data["positive"].items()})
+        sketch.negative.update({int(key): count for key, count in data["negative"].items()})
+        sketch.zeros = data["zeros"]
+        return sketch
+
+
+def is_numeric(column: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
+
+
+def empty_profile() -> dict:
+    return {"rows": 0, "columns": {}}
+
+
+def update_profile(profile: dict, features: pd.DataFrame) -> None:
+    """Add the statistics of one chunk of extract_features output to profile"""
+    profile["rows"] += len(features)
+    for name in PROFILED_COLUMNS:
+        column = features[name]
+        if name not in profile["columns"]:
+            profile["columns"][name] = (
+                {"type": "numeric", "nulls": 0, "sketch": QuantileSketch()} if is_numeric(column)
+                else {"type": "categorical", "nulls": 0, "categories": Counter()}
+            )
+        stats = profile["columns"][name]
+        stats["nulls"] += int(column.isna().sum())
+        if stats["type"] == "numeric":
+            stats["sketch"].update(column.to_numpy(dtype=float))
+        else:
+            stats["categories"].update({str(value): count for value, count in column.value_counts().items()})
+
+
+def profile_chunks(chunks) -> dict:
+    profile = empty_profile()
+    for chunk in chunks:
+        update_profile(profile, extract_features(chunk))
+    return profile
+
+
+def profile_to_dict(profile: dict) -> dict:
+    columns = {}
+    for name, stats in profile["columns"].items():
+        column = {"type": stats["type"], "nulls": stats["nulls"],
+                  "null_rate": stats["nulls"] / profile["rows"] if profile["rows"] else 0.0}
+        if stats["type"] == "numeric":
+            column["quantiles"] = {str(q): stats["sketch"].quantile(q) for q in QUANTILES}
+            column["sketch"] = stats["sketch"].to_dict()
+        else:
+            column["categories"] = dict(stats["categories"].most_common())
+        columns[name] = column
+    return {**profile, "columns": columns}
+
+
+def profile_from_dict(data: dict) -> dict:
+    columns = {}
+    for name, column in data["columns"].items():
+        stats = {"type": column["type"], "nulls": column["nulls"]}
+        if column["type"] == "numeric":
+            stats["sketch"] = QuantileSketch.from_dict(column["sketch"])
+        else:
+            stats["categories"] = Counter(column["categories"])
+        columns[name] = stats
+    return {**data, "columns": columns}
+
+
+def population_stability_index(previous: Counter, current: Counter, eps: float = 1e-4) -> float:
+    previous_total, current_total = sum(previous.values()) or 1, sum(current.values()) or 1
+    psi = 0.0
+    for category in set(previous) | set(current):
+        expected = max(previous[category] / previous_total, eps)
+        actual = max(current[category] / current_total, eps)
+        psi += (actual - expected) * math.log(actual / expected)
+    return psi
+
+
+def relative_change(previous: float, current: float) -> float:
+    if previous == current:
+        return 0.0
+    return abs(current - previous) / max(abs(previous), abs(current))
+
+
+def compare_profiles(previous: dict, current: dict) -> List[str]:
+    """Meaningful changes from the previous profile to the current one"""
+    issues = []
+    if relative_change(previous["rows"], current["rows"]) > ROW_COUNT_CHANGE:
+        issues.append(f"rows: {previous['rows']} -> {current['rows']}")
+    for name, stats in current["columns"].items():
+        old = previous["columns"].get(name)
+        if old is None or old["type"] != stats["type"]:
+            issues.append(f"{name}: new column or type")
+            continue
+        old_null_rate = old["nulls"] / previous["rows"] if previous["rows"] else 0.0
+        null_rate = stats["nulls"] / current["rows"] if current["rows"] else 0.0
+        if abs(null_rate - old_null_rate) > NULL_RATE_CHANGE:
+            issues.append(f"{name}: null rate {old_null_rate:.3f} -> {null_rate:.3f}")
+
+        if stats["type"] == "categorical":
+            psi = population_stability_index(old["categories"], stats["categories"])
+            if psi > CATEGORY_PSI:
+                issues.append(f"{name}: category PSI {psi:.3f}")
+            total = sum(stats["categories"].values()) or 1
+            new = {category: count for category, count in stats["categories"].items()
+                   if category not in old["categories"] and count / total >= NEW_CATEGORY_SHARE}
+            if new:
+                issues.append(f"{name}: new categories {sorted(new)}")
+        else:
+            for q in QUANTILES:
+                old_value, value = old["sketch"].quantile(q), stats["sketch"].quantile(q)
+                if old_value is None or value is None:
+                    if old_value != value:
+                        issues.append(f"{name}: q{q} {old_value} -> {value}")
+                elif relative_change(old_value, value) > QUANTILE_CHANGE:
+                    issues.append(f"{name}: q{q} {old_value:.4g} -> {value:.4g}")
+    return issues
+
+
+def profile_path(scrape_date: str, path: str = PROFILES_PATH) -> str:
+    return os.path.join(path, f"{scrape_date}.json")
+
+
+def save_profile(profile: dict, scrape_date: str, drift: dict, path: str = PROFILES_PATH) -> str:
+    os.makedirs(path, exist_ok=True)
+    file_path = profile_path(scrape_date, path)
+    with open(file_path, "w", encoding="UTF-8") as f:
+        json.dump({"scrape_date": scrape_date, **profile_to_dict(profile), "drift": drift},
+                  f, ensure_ascii=False, indent=4)
+    return file_path
+
+
+def load_profile(scrape_date: str, path: str = PROFILES_PATH) -> dict:
+    with open(profile_path(scrape_date, path), encoding="UTF-8") as f:
+        data = json.load(f)
+    return {**profile_from_dict(data), "drift": data["drift"]}
+
+
+def latest_drift(path: str = PROFILES_PATH) -> Optional[dict]:
+    """Drift result of the latest profiled scrape, None if nothing was profiled"""
+    if not os.path.isdir(path):
+        return None
+    dates = sorted(name[:-len(".json")] for name in os.listdir(path) if name.endswith(".json"))
+    if not dates:
+        return None
+    with open(profile_path(dates[-1], path), encoding="UTF-8") as f:
+        return {"scrape_date": dates[-1], **json.load(f)["drift"]}
+
+
+def previous_scrape_date(scrape_date: str, path: str = PROFILES_PATH) -> Optional[str]:
+    """Latest profiled scrape date before scrape_date"""
+    if not os.path.isdir(path):
+        return None
+    dates = sorted(name[:-len(".json")] for name in os.listdir(path) if name.endswith(".json"))
+    earlier = [date for date in dates if date < scrape_date]
+    return earlier[-1] if earlier else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile a raw scrape and compare it with the previous one")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--scrape-date", required=True, help="date of the scrape in the raw dump (YYYY-MM-DD)")
+    args = parser.parse_args()
+    scrape_date = check_scrape_date(args.scrape_date)
+
+    logging.info(f"Profiling {INPUT_PATH}, scrape date {scrape_date}")
+    profile = profile_chunks(iter_raw_chunks(INPUT_PATH, args.chunk_rows))
+    logging.info(f"Profiled {profile['rows']} rows")
+
+    previous_date = previous_scrape_date(scrape_date)
+    if previous_date is None:
+        issues = ["no previous profile"]
+    else:
+        issues = compare_profiles(load_profile(previous_date), profile)
+    for issue in issues:
+        logging.info(f"Drift: {issue}")
+    drift = {"previous": previous_date, "issues": issues, "retrain": bool(issues)}
+
+    file_path = save_profile(profile, scrape_date, drift)
+    logging.info(f"Profile saved to {file_path}")
+    if drift["retrain"]:
+        logging.info("The data changed, the model should be retrained")
+    else:
+        logging.info(f"No meaningful change since {previous_date}, retraining can be skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Hyperparameter search for the NGBoost model with successive halving.
+
+Random configurations of learning rate, number of estimators, base learner
+depth and minibatch fraction are fitted in a process pool with the same
+early stopping as train_model.py. Every rung fits the surviving
+configurations with a larger share of their boosting stages and keeps the
+best third by RMSE on a selection split, so most of the compute goes to
+the promising ones. The metrics and timing of every trial are appended to
+TRIALS_PATH as JSON lines. The test split takes no part in the search: only
+the chosen models are refitted and scored on it, so the reported metrics
+are not biased by the selection.
+"""
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from loguru import logger
+from ngboost.learners import default_tree_learner
+from sklearn.base import clone
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import train_test_split
+from sklearn.utils import check_random_state
+
+from confidence_interval import get_ci
+from train_model import RANDOM_STATE, WORKERS, fit_model, get_model, read_data
+
+logger.add("logs/search.log", format="{time} {level} {message}", level="INFO", rotation="10 MB")
+
+TRIALS_PATH = "models/hyperparameter_search.jsonl"
+N_TRIALS = 27
+# Successive halving: every rung keeps 1 / ETA of the trials and gives them ETA times more stages
+ETA = 3
+N_RUNGS = 3
+TEST_FRACTION = 0.2
+# Share of the remaining data used to rank the trials of every rung
+SELECTION_FRACTION = 0.2
+# A model is as good as the best one if its RMSE is at most this much worse
+RMSE_TOLERANCE = 0.01
+
+SEARCH_SPACE = {
+    "learning_rate": [0.005, 0.01, 0.02, 0.05, 0.1],
+    "n_estimators": [250, 500, 1000, 2000],
+    "max_depth": [2, 3, 4, 5],
+    "minibatch_frac": [0.5, 0.8, 1.0],
+}
+
+
+def sample_configs(n_trials: int, seed: int = RANDOM_STATE) -> list:
+    """n_trials distinct random configurations from SEARCH_SPACE"""
+    rng = random.Random(seed)
+    n_trials = min(n_trials, math.prod(len(values) for values in SEARCH_SPACE.values()))
+    configs = []
+    while len(configs) < n_trials:
+        config = {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def make_model(config: dict, n_estimators: int):
+    model = get_model()
+    model.set_params(
+        n_estimators=n_estimators,
+        learning_rate=config["learning_rate"],
+        minibatch_frac=config["minibatch_frac"],
+        Base=clone(default_tree_learner).set_params(max_depth=config["max_depth"], random_state=RANDOM_STATE),
+        # NGBoost converts the seed in __init__ only, set_params needs the RandomState
+        random_state=check_random_state(RANDOM_STATE),
+    )
+    return model
+
+
+def run_trial(config: dict, rung: int, n_estimators: int, X_train: np.array, y_train: np.array,
+              X_score: np.array, y_score: np.array) -> dict:
+    """Fit config with at most n_estimators stages and score it on X_score"""
+    model, fit_time = fit_model(make_model(config, n_estimators), X_train, y_train)
+    start = time.perf_counter()
+    ci = get_ci(model, X_score)
+    predict_time = time.perf_counter() - start
+    return {
+        "config": config,
+        "rung": rung,
+        "max_estimators": n_estimators,
+        "stages": model.n_estimators,
+        "rmse": mean_squared_error(y_score, ci[:, 0]) ** 0.5,
+        "ci_coverage": float(np.mean((ci[:, 1] < y_score) & (ci[:, 2] > y_score))),
+        "ci_width": float(np.mean(ci[:, 2] - ci[:, 1])),
+        "fit_time": fit_time,
+        "predict_time": predict_time,
+    }
+
+
+def save_trial(trial: dict, path: str = TRIALS_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="UTF-8") as f:
+        f.write(json.dumps(trial) + "\n")
+
+
+def successive_halving(configs: list, X_train: np.array, y_train: np.array, X_select: np.array,
+                       y_select: np.array, workers: int = WORKERS) -> list:
+    """Run all rungs and return every trial, the last rung ones fitted with full stages.
+
+    Trials are scored and ranked on the selection split (X_select, y_select).
+    """
+    trials = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rung in range(N_RUNGS):
+            share = ETA ** (rung - N_RUNGS + 1)
+            started = time.perf_counter()
+            futures = [
+                pool.submit(run_trial, config, rung, max(1, int(config["n_estimators"] * share)),
+                            X_train, y_train, X_select, y_select)
+                for config in configs
+            ]
+            rung_trials = [future.result() for future in futures]
+            for trial in rung_trials:
+                save_trial(trial)
+                logger.info(
+                    f"Rung {rung} {trial['config']}: RMSE {trial['rmse']:.5f}, "
+                    f"CI coverage {trial['ci_coverage']:.3f}, {trial['stages']} / {trial['max_estimators']} stages, "
+                    f"fit {trial['fit_time']:.1f} s"
+                )
+            logger.info(f"Rung {rung}: {len(configs)} trials took {time.perf_counter() - started:.1f} s")
+            trials.extend(rung_trials)
+            rung_trials.sort(key=lambda trial: trial["rmse"])
+            configs = [trial["config"] for trial in rung_trials[:max(1, len(rung_trials) // ETA)]]
+    return trials
+
+
+def main():
+    logger.info("Start hyperparameter search")
+    X, y = read_data()
+    X = DictVectorizer(sparse=False).fit_transform(X.to_dict(orient="records"))
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, np.asarray(y), test_size=TEST_FRACTION, random_state=RANDOM_STATE
+    )
+    X_fit, X_select, y_fit, y_select = train_test_split(
+        X_train, y_train, test_size=SELECTION_FRACTION, random_state=RANDOM_STATE
+    )
+
+    configs = sample_configs(N_TRIALS)
+    logger.info(f"Searching {len(configs)} configurations in {N_RUNGS} rungs with {WORKERS} processes")
+    start = time.perf_counter()
+    trials = successive_halving(configs, X_fit, y_fit, X_select, y_select)
+    logger.info(f"Search took {time.perf_counter() - start:.1f} s, trials saved to {TRIALS_PATH}")
+
+    final = [trial for trial in trials if trial["rung"] == N_RUNGS - 1]
+    best = min(final, key=lambda trial: trial["rmse"])
+    # The smallest model of any rung that is as accurate and covers as well as the best one
+    good = [
+        trial for trial in trials
+        if trial["rmse"] <= best["rmse"] * (1 + RMSE_TOLERANCE) and trial["ci_coverage"] >= best["ci_coverage"]
+    ]
+    smallest = min(good, key=lambda trial: trial["stages"])
+
+    # Only the chosen models see the test split, refitted on the same data with the same seed
+    for name, trial in [("Best", best), ("Smallest comparable", smallest)]:
+        test = run_trial(trial["config"], trial["rung"], trial["max_estimators"], X_fit, y_fit, X_test, y_test)
+        logger.success(
+            f"{name} model: selection RMSE {trial['rmse']:.5f}, test RMSE {test['rmse']:.5f}, "
+            f"test CI coverage {test['ci_coverage']:.3f}, {test['stages']} stages: {trial['config']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
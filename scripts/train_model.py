@@ -1,25 +1,67 @@
+import argparse
+import json
+import os
 import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
 
 import pandas as pd
 import numpy as np
 from loguru import logger
+from sklearn.base import clone
 from sklearn.feature_extraction import DictVectorizer
 from ngboost import NGBRegressor
 from ngboost.distns import Normal
-from sklearn.model_selection import cross_val_score
+from sklearn.model_selection import KFold, train_test_split
 from sklearn.metrics import mean_squared_error
 
+from confidence_interval import get_ci
+from feature_encoder import FeatureEncoder
+from flat_trees import FlatNGBoost
+from model_artifact import save_artifact
+from processed_dataset import read_dataset
+from profile_data import latest_drift
+
 logger.add("logs/train.log", format="{time} {level} {message}", level="INFO", rotation="10 MB")
 
-INPUT_PATH = "data/processed/clean_data.csv"
+INPUT_PATH = "data/processed/clean_data"
 MODEL_PATH = "models/ngboost_model.pkl"
+ARTIFACT_PATH = "models/ngboost_serving"
+TRAINING_INFO_PATH = "models/ngboost_training.json"
+N_FOLDS = 5
+# Upper bound of boosting stages, early stopping picks the number actually kept
+N_ESTIMATORS = 2000
+VALIDATION_FRACTION = 0.1
+EARLY_STOPPING_ROUNDS = 50
+RANDOM_STATE = 42
+# Confidence intervals checked on the train data
+CI_LEVELS = (0.68, 0.95)
+# Upper bound of stages added to the previous model in the warm start mode
+WARM_START_STAGES = 200
+# Processes fitting the cross validation folds and the final model
+WORKERS = int(os.environ.get("TRAIN_WORKERS", os.cpu_count() or 1))
+
 
+def read_data() -> Tuple[pd.DataFrame, pd.Series]:
+    """Read data of all scrape dates from INPUT_PATH, the latest one of every product.
 
-def read_data() -> pd.DataFrame:
-    """Read data from INPUT_PATH"""
-    df = pd.read_csv(INPUT_PATH)
+    Every partition is a full snapshot of the catalogue, so a product scraped
+    on several dates is kept once, with its newest features and price.
+    Otherwise it would be counted once per scrape and land in several folds.
+    X and y are indexed by product ID.
+    """
+    df = read_dataset(INPUT_PATH)
+    n_rows, n_dates = len(df), df["scrape_date"].nunique()
+    df = (
+        df.sort_values("scrape_date", kind="stable")
+        .drop_duplicates("product_id", keep="last")
+        .sort_index()
+        .set_index("product_id")
+    )
+    logger.info(f"{n_rows} rows of {n_dates} scrape dates, {len(df)} unique products")
     y = df["priceLog"]
-    X = df.drop("priceLog", axis=1)
+    X = df.drop(["priceLog", "scrape_date"], axis=1)
     logger.info(f"Data read. X shape: {X.shape}, y shape: {y.shape}")
     logger.info(f"X columns: {X.columns}")
     return X, y
@@ -30,49 +72,226 @@ def get_model() -> NGBRegressor:
     model = NGBRegressor(
         Dist=Normal,
         verbose=False,
-        n_estimators=2000
+        n_estimators=N_ESTIMATORS
     )
     return model
 
 
-def cross_validation_score(model: NGBRegressor, X: np.array, y: np.array) -> None:
-    """Calculate cross validation score for model"""
-    result = list(np.round((-cross_val_score(model, X, y, cv=5, scoring='neg_mean_squared_error')) ** 0.5, 5))
+def truncate_model(model: NGBRegressor, n_estimators: int) -> NGBRegressor:
+    """Keep only the first n_estimators boosting stages of model"""
+    model.base_models = model.base_models[:n_estimators]
+    model.scalings = model.scalings[:n_estimators]
+    model.col_idxs = model.col_idxs[:n_estimators]
+    model.n_estimators = n_estimators
+    return model
+
+
+def fit_model(model: NGBRegressor, X: np.array, y: np.array,
+              validation: Optional[np.array] = None) -> Tuple[NGBRegressor, float]:
+    """Fit model with early stopping, return it with the fit time in seconds.
+
+    The validation rows, a random VALIDATION_FRACTION of them if not given,
+    are held out, boosting stops after EARLY_STOPPING_ROUNDS stages without
+    improvement of the validation loss and the model is truncated to the
+    best stage.
+    """
+    start = time.perf_counter()
+    X_train, X_val, y_train, y_val = split_validation(X, y, validation)
+    model.fit(X_train, y_train, X_val=X_val, Y_val=y_val, early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+    truncate_model(model, model.best_val_loss_itr + 1)
+    return model, time.perf_counter() - start
+
+
+def validation_mask(product_ids: pd.Index) -> np.array:
+    """Rows held out for validation, VALIDATION_FRACTION of the products chosen by a hash of their ID.
+
+    A product stays on the same side on every run, whatever other products
+    were added or removed, so the model being warm started has never been
+    trained on the validation rows.
+    """
+    buckets = pd.util.hash_pandas_object(pd.Series(product_ids), index=False).to_numpy() % 1000
+    return buckets < VALIDATION_FRACTION * 1000
+
+
+def split_validation(X: np.array, y: np.array, validation: Optional[np.array] = None) -> list:
+    """Train and validation parts of X and y, a random split with a fixed seed if validation isn't given"""
+    if validation is None:
+        return train_test_split(X, y, test_size=VALIDATION_FRACTION, random_state=RANDOM_STATE)
+    return X[~validation], X[validation], y[~validation], y[validation]
+
+
+def validation_rmse(model: NGBRegressor, X: np.array, y: np.array, validation: np.array) -> float:
+    _, X_val, _, y_val = split_validation(X, y, validation)
+    return mean_squared_error(y_val, model.predict(X_val)) ** 0.5
+
+
+def warm_start_fit(model: NGBRegressor, X: np.array, y: np.array, validation: np.array,
+                   extra_stages: int = WARM_START_STAGES) -> Tuple[NGBRegressor, float]:
+    """Continue boosting a fitted model on new data, return it with the fit time in seconds.
+
+    At most extra_stages stages are added with the same early stopping as
+    fit_model. NGBoost refits the initial parameters to the new data first,
+    the added stages correct the existing ones for it.
+    """
+    start = time.perf_counter()
+    X_train, X_val, y_train, y_val = split_validation(X, y, validation)
+    model.n_estimators = extra_stages
+    model.partial_fit(X_train, y_train, X_val=X_val, Y_val=y_val, early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+    truncate_model(model, model.best_val_loss_itr + 1)
+    return model, time.perf_counter() - start
+
+
+def full_refit_reason(dv: DictVectorizer, records: list) -> Optional[str]:
+    """Why the previous model can't be warm started on records, None if it can"""
+    drift = latest_drift()
+    if drift is not None and drift["retrain"]:
+        return f"data of {drift['scrape_date']} drifted: {'; '.join(drift['issues'])}"
+    unknown = {
+        f"{field}{dv.separator}{value}"
+        for record in records for field, value in record.items() if isinstance(value, str)
+    } - set(dv.vocabulary_)
+    if unknown:
+        return f"categories unknown to the previous model: {sorted(unknown)}"
+    return None
+
+
+def fit_fold(model: NGBRegressor, X: np.array, y: np.array,
+             train_idx: np.array, test_idx: np.array) -> Tuple[float, float, int]:
+    """Test RMSE of model fitted on the train rows, the fit time in seconds
+    and the number of boosting stages kept"""
+    model, fit_time = fit_model(model, X[train_idx], y[train_idx])
+    rmse = mean_squared_error(y[test_idx], model.predict(X[test_idx])) ** 0.5
+    return rmse, fit_time, model.n_estimators
+
+
+def cross_validate_and_fit(model: NGBRegressor, X: np.array, y: np.array, validation: np.array,
+                           workers: int = WORKERS) -> Tuple[NGBRegressor, float]:
+    """Calculate cross validation score and fit model on all data, return it with the fit time.
+
+    The final model is early stopped on the validation rows, the ones later
+    warm starts are validated on. The folds and the final fit are
+    independent, so they run concurrently in a pool of workers processes and
+    the whole takes about one fit when there are enough cores.
+    """
+    y = np.asarray(y)
+    start = time.perf_counter()
+    logger.info(f"Fitting {N_FOLDS} folds and the final model in {workers} processes")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # The final fit is the longest one, start it first
+        final = pool.submit(fit_model, clone(model), X, y, validation)
+        folds = [
+            pool.submit(fit_fold, clone(model), X, y, train_idx, test_idx)
+            for train_idx, test_idx in KFold(n_splits=N_FOLDS).split(X)
+        ]
+        result = []
+        for fold_num, fold in enumerate(folds):
+            rmse, fit_time, n_estimators = fold.result()
+            logger.info(f"Fold {fold_num}: RMSE {rmse:.5f}, {n_estimators} stages, fit took {fit_time:.1f} s")
+            result.append(round(rmse, 5))
+        model, fit_time = final.result()
+    logger.info(f"Final fit took {fit_time:.1f} s, best iteration {model.best_val_loss_itr}, "
+                f"{model.n_estimators} of {N_ESTIMATORS} stages kept")
     logger.info(f"Cross validation RMSE for {model}")
     logger.info(f"cv_results: {result}")
     logger.info(f"Mean RMSE: {np.mean(result):.5f}")
+    logger.info(f"Cross validation and fit took {time.perf_counter() - start:.1f} s")
+    return model, fit_time
+
 
+def ci_train_score(model: NGBRegressor, X: np.array, y: np.array) -> None:
+    """Calculate train RMSE and the share of y inside the 68% and 95% confidence intervals"""
+    ci = get_ci(model, X, CI_LEVELS)
+    logger.info(f"Train RMSE = {mean_squared_error(ci[:, 0], y) ** 0.5:2f}")
+    for pos, level in enumerate(CI_LEVELS):
+        y_in_ci_mean = np.mean((ci[:, 1 + 2 * pos] < y) & (ci[:, 2 + 2 * pos] > y))
+        logger.info(f"Mean y in {level:.0%} CI: {y_in_ci_mean:.3f}")
 
-def get_ci(model: NGBRegressor, X: np.array) -> np.array:
-    """Get predictions, and 95% confidence interval for X"""
-    z_score = 1.95  # 95% confidence interval
-    preds = model.pred_param(X)
-    mean = preds[:, 0]
-    lower = preds[:, 0] - z_score * np.exp(preds[:, 1])
-    upper = preds[:, 0] + z_score * np.exp(preds[:, 1])
-    return np.c_[mean, lower, upper]
 
+def export_flat_model(model: NGBRegressor, dv: DictVectorizer, records: list, X: np.array) -> None:
+    """Save the serving artifact and check it reproduces dv.transform and pred_param"""
+    encoder = FeatureEncoder.from_vectorizer(dv)
+    if not np.array_equal(encoder.transform(records), X, equal_nan=True):
+        raise ValueError("FeatureEncoder output differs from DictVectorizer.transform")
+    flat_model = FlatNGBoost.from_ngboost(model)
+    flat_preds, preds = flat_model.pred_param(X), model.pred_param(X)
+    max_diff = np.max(np.abs(flat_preds - preds))
+    if not np.allclose(flat_preds, preds):
+        raise ValueError(f"Flat model differs from pred_param by {max_diff}")
+    logger.info(f"Flat model max abs difference from pred_param: {max_diff:.2e}")
+    save_artifact(ARTIFACT_PATH, flat_model, encoder)
+    logger.success(f"Serving artifact saved to {ARTIFACT_PATH}")
 
-def ci_train_score(model: NGBRegressor, X: np.array, y: np.array) -> None:
-    """Calculate train RMSE and 95% confidence interval for model"""
-    ci = get_ci(model, X)
-    logger.info(f"Train RMSE = {mean_squared_error(model.predict(X), y) ** 0.5:2f}")
-    y_in_ci_mean = np.mean((ci[:, 1] < y) & (ci[:, 2] > y))
-    logger.info(f"Mean y in CI: {y_in_ci_mean:.3f}")
+
+def read_training_info() -> dict:
+    if not os.path.exists(TRAINING_INFO_PATH):
+        return {}
+    with open(TRAINING_INFO_PATH, encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def save_training_info(info: dict) -> None:
+    with open(TRAINING_INFO_PATH, "w", encoding="UTF-8") as f:
+        json.dump(info, f, indent=4)
+
+
+def warm_start(model: NGBRegressor, X: np.array, y: np.array, validation: np.array,
+               extra_stages: int, compare: bool) -> dict:
+    """Warm start model and report the time and validation RMSE against a full retrain"""
+    n_before = model.n_estimators
+    rmse_before = validation_rmse(model, X, y, validation)
+    model, fit_time = warm_start_fit(model, X, y, validation, extra_stages)
+    rmse = validation_rmse(model, X, y, validation)
+    logger.info(f"Warm start added {model.n_estimators - n_before} of at most {extra_stages} stages "
+                f"in {fit_time:.1f} s, validation RMSE {rmse_before:.5f} -> {rmse:.5f}")
+
+    full_fit_time = read_training_info().get("full_fit_time")
+    if compare:
+        logger.info("Fitting a full model for comparison")
+        full_model, full_fit_time = fit_model(get_model(), X, y, validation)
+        full_rmse = validation_rmse(full_model, X, y, validation)
+        logger.info(f"Validation RMSE: warm start {rmse:.5f}, full retrain {full_rmse:.5f}, "
+                    f"difference {rmse - full_rmse:+.5f}")
+    if full_fit_time is not None:
+        logger.info(f"Warm start took {fit_time:.1f} s instead of {full_fit_time:.1f} s for a full fit, "
+                    f"{full_fit_time - fit_time:.1f} s saved")
+    return {"mode": "warm_start", "fit_time": fit_time, "full_fit_time": full_fit_time, "validation_rmse": rmse}
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Train the NGBoost price model")
+    parser.add_argument("--warm-start", action="store_true",
+                        help=f"continue boosting the model in {MODEL_PATH} unless the data drifted")
+    parser.add_argument("--extra-stages", type=int, default=WARM_START_STAGES,
+                        help="maximum number of stages added by the warm start")
+    parser.add_argument("--compare", action="store_true",
+                        help="also fit a full model to compare the warm start with")
+    args = parser.parse_args()
+
     logger.info("Start training NGBoost model")
     logger.info("Reading data")
     X, y = read_data()
+    y = np.asarray(y)
+    validation = validation_mask(X.index)
+    records = X.to_dict(orient="records")
 
-    dv = DictVectorizer(sparse=False)
-    X = dv.fit_transform(X.to_dict(orient="records"))
+    model = None
+    if args.warm_start:
+        with open(MODEL_PATH, "rb") as f:
+            model, dv = pickle.load(f)
+        reason = full_refit_reason(dv, records)
+        if reason is not None:
+            logger.info(f"Fitting from scratch instead of the warm start, {reason}")
+            model = None
 
-    model = get_model()
-    cross_validation_score(model, X, y)
-
-    model.fit(X, y)
+    if model is not None:
+        X = dv.transform(records)
+        info = warm_start(model, X, y, validation, args.extra_stages, args.compare)
+    else:
+        dv = DictVectorizer(sparse=False)
+        X = dv.fit_transform(records)
+        model, fit_time = cross_validate_and_fit(get_model(), X, y, validation)
+        info = {"mode": "full", "fit_time": fit_time, "full_fit_time": fit_time,
+                "validation_rmse": validation_rmse(model, X, y, validation)}
     ci_train_score(model, X, y)
 
     logger.info("Saving model")
@@ -80,6 +299,9 @@ def main():
         pickle.dump((model, dv), f)
         logger.success("Model saved")
 
+    export_flat_model(model, dv, records, X)
+    save_training_info({**info, "n_estimators": model.n_estimators, "rows": len(y)})
+
 
 if __name__ == "__main__":
     main()
@@ -7,7 +7,12 @@ from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from client_states import DialogueStates
 from keyboards import get_reply_keyboard_markup
 from messages_for_main_menu import text_output_for_command
-from possible_answers import choices_per_stage, all_processors_regexp, hdmi_port_answers
+from possible_answers import (
+    choices_per_stage,
+    all_processors_regexp,
+    hdmi_port_answers,
+    processor_series_features,
+)
 from json.decoder import JSONDecodeError
 from dotenv import load_dotenv
 
@@ -20,6 +25,31 @@ API_URL = 'https://njs0kuvzkj.execute-api.us-west-1.amazonaws.com/prod/predict-p
 bot = Bot(token=token)
 dispatcher = Dispatcher(bot, storage=MemoryStorage())
 ML_APP_URL = 'http://127.0.0.1:8000/get_model_prediction'
+# Лямбда по умолчанию, для своего сервера (scripts/prediction_server.py) задать PREDICTION_URL=ML_APP_URL
+PREDICTION_URL = os.getenv('PREDICTION_URL', API_URL)
+# Одна сессия на все запросы, чтобы переиспользовать keep-alive соединение
+prediction_session = requests.Session()
+
+
+def get_model_features(answers: dict) -> dict:
+    """Переводит ответы пользователя в признаки, на которых обучена модель.
+
+    Набор признаков и их значения совпадают с сеткой предрасчитанных цен
+    (scripts/build_price_table.py), поэтому типовые ответы не требуют вызова модели.
+    """
+    return {
+        'brand_name': answers['processor_brand'].lower(),
+        **processor_series_features.get(answers['processor_series'], processor_series_features['other']),
+        'proc_count': answers['processor_cores'],
+        'videocard': answers['videocard_type'],
+        'videocard_memory': answers['videocard_memory'],
+        'screen': answers['screen_diagonal'],
+        'ssd_volume': answers['ssd_volume'],
+        'ram': answers['ram_volume'],
+        'hdmi': bool(answers['hdmi_port']),
+        'material': answers['material'],
+        'battery_life': answers['battery_life'],
+    }
 
 
 @dispatcher.message_handler(commands=['start'])
@@ -301,9 +331,9 @@ async def estimate_command(message: types.Message, state: FSMContext):
             features += f'{key} = {value}\n'
         print(data.as_dict())
         try:
-            prices = requests.post(
-                url=API_URL,
-                json=data.as_dict(),
+            prices = prediction_session.post(
+                url=PREDICTION_URL,
+                json=get_model_features(data.as_dict()),
                 headers={'x-api-key': API_KEY},
             ).json()
         except JSONDecodeError:
@@ -34,3 +34,19 @@ hdmi_port_answers = {
     'Да, как без него вообще жить можно!': 1,
     'Не, без него обойдусь...': 0,
 }
+
+# Признаки процессора, которые ожидает модель, для каждого семейства из меню
+processor_series_features = {
+    'M1': {'proc_brand': 'apple', 'proc_name': 'apple m1'},
+    'M2': {'proc_brand': 'apple', 'proc_name': 'apple m2'},
+    'intel core i3': {'proc_brand': 'intel', 'proc_name': 'intel core i3'},
+    'intel core i5': {'proc_brand': 'intel', 'proc_name': 'intel core i5'},
+    'intel core i7': {'proc_brand': 'intel', 'proc_name': 'intel core i7'},
+    'intel pentium': {'proc_brand': 'intel', 'proc_name': 'intel pentium'},
+    'intel celeron': {'proc_brand': 'intel', 'proc_name': 'intel celeron'},
+    'intel core': {'proc_brand': 'intel', 'proc_name': 'intel'},
+    'zhaoxin': {'proc_brand': 'zhaoxin', 'proc_name': 'zhaoxin'},
+    'qualcomm': {'proc_brand': 'qualcomm', 'proc_name': 'qualcomm'},
+    'AMD ryzen': {'proc_brand': 'amd', 'proc_name': 'amd ryzen'},
+    'other': {'proc_brand': 'other', 'proc_name': 'other'},
+}